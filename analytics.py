@@ -0,0 +1,167 @@
+"""
+Season prediction analytics: consensus picks, driver popularity, contrarian
+scores and head-to-head records.
+
+PredictionCube keeps the aggregates the pages query, built up one race at a
+time: the race x position x driver pick counts once a race's predictions are
+closed, and the user x race scores once its official results are in. Adding a
+race only touches that race's slice, and every query is a slice of the arrays.
+The cube is stored as a compressed .npz object.
+"""
+from io import BytesIO
+import numpy as np
+import pandas as pd
+
+class PredictionCube:
+    """
+    Pick counts and scores for every race added so far.
+    counts: int32 array (races, positions, drivers), how many users picked a
+    driver for a position
+    contrarian: float32 array (users, races), mean over a user's picks of the share
+    of the other users who did not make the same pick (NaN if they did not predict)
+    scores: int32 array (users, races), scored: bool array (races,) for races with results
+    Users and drivers are kept in the order they first appear.
+    """
+
+    def __init__(self, positions=10):
+        self.positions = positions
+        self.races = []
+        self.users = []
+        self.drivers = []
+        self._race_index = {}
+        self._user_index = {}
+        self._driver_index = {}
+        self.counts = np.zeros((0, positions, 0), dtype='int32')
+        self.contrarian = np.zeros((0, 0), dtype='float32')
+        self.scores = np.zeros((0, 0), dtype='int32')
+        self.scored = np.zeros(0, dtype=bool)
+
+    def _add_users(self, users):
+        new_users = [user for user in users if user not in self._user_index]
+        for user in new_users:
+            self._user_index[user] = len(self.users)
+            self.users.append(user)
+        if new_users:
+            self.contrarian = np.pad(self.contrarian, ((0, len(new_users)), (0, 0)), constant_values=np.nan)
+            self.scores = np.pad(self.scores, ((0, len(new_users)), (0, 0)))
+
+    def _add_drivers(self, drivers):
+        new_drivers = [driver for driver in drivers if driver not in self._driver_index]
+        for driver in new_drivers:
+            self._driver_index[driver] = len(self.drivers)
+            self.drivers.append(driver)
+        if new_drivers:
+            self.counts = np.pad(self.counts, ((0, 0), (0, 0), (0, len(new_drivers))))
+
+    def add_picks(self, race, codes):
+        """
+        Adds one race's closed predictions. Adding a race that is already included
+        is a no-op.
+        codes: prediction_codes.PredictionCodes holding the race
+        """
+        if race in self._race_index or not codes.has_race(race):
+            return
+        users, picks = codes.race_picks(race)
+        self._add_users(codes.decode_users(users).tolist())
+        self._add_drivers(codes.drivers)
+
+        self._race_index[race] = len(self.races)
+        self.races.append(race)
+        # The codes' driver numbering -> ours, -1 (no pick) stays -1
+        picks = np.append(np.array([self._driver_index[driver] for driver in codes.drivers], dtype='int64'), -1)[picks]
+        picked = picks >= 0
+        counts = np.zeros((1, self.positions, len(self.drivers)), dtype='int32')
+        np.add.at(counts[0], (np.nonzero(picked)[1], picks[picked]), 1)
+        self.counts = np.concatenate([self.counts, counts])
+
+        # Share of the other users who picked something else for the same position
+        others = max(len(users) - 1, 1)
+        same = np.where(picked, counts[0][np.arange(self.positions), picks] - 1, others)
+        column = np.full(len(self.users), np.nan, dtype='float32')
+        column[[self._user_index[user] for user in codes.decode_users(users)]] = 1 - same.mean(axis=1) / others
+        self.contrarian = np.column_stack([self.contrarian, column])
+        self.scores = np.column_stack([self.scores, np.zeros(len(self.users), dtype='int32')])
+        self.scored = np.append(self.scored, False)
+
+    def add_scores(self, race, race_table):
+        """
+        Adds one race's scores once its picks are in.
+        race_table: DataFrame with columns Predictor and Score (e.g. a race snapshot)
+        """
+        j = self._race_index.get(race)
+        if j is None or self.scored[j]:
+            return
+        known = race_table[race_table['Predictor'].isin(self.users)]
+        self.scores[[self._user_index[user] for user in known['Predictor']], j] = known['Score'].to_numpy()
+        self.scored[j] = True
+
+    @property
+    def scored_races(self):
+        return [race for race, scored in zip(self.races, self.scored) if scored]
+
+    def consensus(self, race):
+        """Returns the most picked driver per position: DataFrame indexed P1-P10 with Driver, Picks and Share."""
+        counts = self.counts[self._race_index[race]]
+        top = counts.argmax(axis=1)
+        picks = counts[np.arange(self.positions), top]
+        return pd.DataFrame({'Driver': np.asarray(self.drivers, dtype=object)[top],
+                             'Picks': picks,
+                             'Share': (picks / np.maximum(counts.sum(axis=1), 1)).round(2)},
+                            index=[f'P{i+1}' for i in range(self.positions)])
+
+    def popularity(self, race=None):
+        """
+        Returns how often each driver was picked (in one race, or all races): DataFrame
+        indexed by Driver with Picks, Top 3 picks and Average position, most picked first.
+        """
+        counts = self.counts[self._race_index[race]] if race is not None else self.counts.sum(axis=0)
+        picks = counts.sum(axis=0)
+        positions = np.arange(1, self.positions + 1)
+        popularity_df = pd.DataFrame({'Picks': picks,
+                                      'Top 3 picks': counts[:3].sum(axis=0),
+                                      'Average position': (positions @ counts / np.maximum(picks, 1)).round(1)},
+                                     index=pd.Index(self.drivers, name='Driver'))
+        return popularity_df[popularity_df['Picks'] > 0].sort_values('Picks', ascending=False)
+
+    def contrarian_scores(self):
+        """Returns each user's contrarian score (0-1, higher is more contrarian) over the races they predicted."""
+        predicted = ~np.isnan(self.contrarian)
+        totals = np.where(predicted, self.contrarian, 0).sum(axis=1)
+        return pd.Series((totals / np.maximum(predicted.sum(axis=1), 1)).round(3),
+                         index=pd.Index(self.users, name='Predictor'), name='Contrarian').sort_values(ascending=False)
+
+    def head_to_head(self, user):
+        """
+        Returns user's record against everyone else over the scored races they both
+        predicted: DataFrame indexed by Opponent with Wins, Losses and Ties.
+        """
+        i = self._user_index[user]
+        both = ~np.isnan(self.contrarian) & self.scored
+        both = both & both[i]
+        diff = self.scores[i] - self.scores
+        record = pd.DataFrame({'Wins': ((diff > 0) & both).sum(axis=1),
+                               'Losses': ((diff < 0) & both).sum(axis=1),
+                               'Ties': ((diff == 0) & both).sum(axis=1)},
+                              index=pd.Index(self.users, name='Opponent'))
+        return record.drop(index=user).sort_values(['Wins', 'Ties'], ascending=False)
+
+    def to_bytes(self):
+        buffer = BytesIO()
+        np.savez_compressed(buffer, races=np.array(self.races, dtype=str), users=np.array(self.users, dtype=str),
+                            drivers=np.array(self.drivers, dtype=str), counts=self.counts,
+                            contrarian=self.contrarian, scores=self.scores, scored=self.scored)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, body):
+        state = np.load(BytesIO(body), allow_pickle=False)
+        cube = cls(positions=state['counts'].shape[1])
+        cube.races = state['races'].tolist()
+        cube.users = state['users'].tolist()
+        cube.drivers = state['drivers'].tolist()
+        cube._race_index = {race: i for i, race in enumerate(cube.races)}
+        cube._user_index = {user: i for i, user in enumerate(cube.users)}
+        cube._driver_index = {driver: i for i, driver in enumerate(cube.drivers)}
+        for name in ['counts', 'contrarian', 'scores', 'scored']:
+            setattr(cube, name, state[name])
+        return cube
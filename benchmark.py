@@ -0,0 +1,328 @@
+"""
+Benchmarks for scoring, ranking and standings at synthetic league scale.
+
+    python benchmark.py                        # every size, compared with benchmark_baselines.json
+    python benchmark.py --sizes 10 1000        # only some league sizes
+    python benchmark.py --update-baselines     # record this machine's numbers as the new baselines
+    python benchmark.py --startup              # cold-start import times instead of scoring
+
+Each size is a synthetic season (--rounds rounds, 20 drivers of which 2 are not
+classified, users sharing picks so there are ties), generated from a fixed seed.
+Every stage is timed (best of --repeat) and run once more under tracemalloc for
+its peak memory. S3 and the F1 API are replaced by in-process fixtures, so
+nothing touches the network.
+
+A stage fails if it is more than --tolerance slower or heavier than its
+baseline, and a size fails if its standings checksum changed (the scores
+themselves are different). Any failure makes the exit code 1. Timings depend
+on the machine, so re-record the baselines with --update-baselines when moving
+the benchmark to a different one.
+
+--startup times a cold start in fresh interpreters instead: importing the
+login page (streamlit_app), then utils and the first S3 client. It fails if
+the login page pulls in any of LAZY_MODULES, which must only load on first use.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from hashlib import md5
+from io import BytesIO
+import numpy as np
+import pandas as pd
+from botocore.exceptions import ClientError
+import f1_api
+import leagues
+import standings
+import storage
+import utils
+
+BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baselines.json')
+SIZES = [10, 1000, 10000, 100000]
+N_DRIVERS = 20
+N_UNCLASSIFIED = 2
+# The per-user calculate_scores path is only timed on this many users
+PER_USER_SAMPLE = 500
+BENCH_LEAGUE = leagues.League('bench', 'bench')
+
+# Modules the login page must render without, they are loaded on first use
+LAZY_MODULES = ['boto3', 'botocore', 'pandas', 'plotly']
+
+# Runs in a fresh interpreter and prints the cumulative seconds after each cold-start step
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+steps = {}
+import streamlit
+steps['import streamlit'] = time.perf_counter() - start
+import streamlit_app
+steps['login page (streamlit_app)'] = time.perf_counter() - start
+loaded = [module for module in LAZY_MODULES if module in sys.modules]
+import utils
+steps['utils'] = time.perf_counter() - start
+utils.get_s3_client()
+steps['first S3 client'] = time.perf_counter() - start
+print(json.dumps({'steps': steps, 'loaded': loaded}))
+"""
+
+class InMemoryS3:
+    """The part of the boto3 S3 client the app uses, backed by a dict."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def _missing(self, operation):
+        return ClientError({'Error': {'Code': 'NoSuchKey'}, 'ResponseMetadata': {'HTTPStatusCode': 404}}, operation)
+
+    def put_object(self, Bucket, Key, Body, Metadata=None, **kwargs):
+        body = Body.encode() if isinstance(Body, str) else bytes(Body)
+        etag = f'"{md5(body).hexdigest()}"'
+        self.objects[Key] = (body, etag, Metadata or {})
+        return {'ETag': etag}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise self._missing('GetObject')
+        body, etag, metadata = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError({'Error': {'Code': '304'}, 'ResponseMetadata': {'HTTPStatusCode': 304}}, 'GetObject')
+        return {'Body': BytesIO(body), 'ETag': etag, 'Metadata': metadata}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            self.objects.pop(item['Key'], None)
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket, Prefix=''):
+        yield {'Contents': [{'Key': key} for key in sorted(self.objects) if key.startswith(Prefix)]}
+
+def synthetic_season(n_users, n_rounds, seed=0):
+    """
+    Returns (predictions_df, schedule payload, {round: results payload}) in the
+    F1 API's shapes. About a third of the users copy another user's picks, so
+    every race has tied scores, and N_UNCLASSIFIED drivers per race are missing
+    from the results.
+    """
+    rng = np.random.default_rng(seed)
+    drivers = np.array([f"Driver {i:02d}" for i in range(N_DRIVERS)], dtype=object)
+    races = [f"Round {round:02d} Grand Prix" for round in range(1, n_rounds + 1)]
+    frames = []
+    results = {}
+    for round, race in enumerate(races, start=1):
+        picks = rng.random((n_users, N_DRIVERS)).argsort(axis=1)[:, :len(utils.PREDICTION_COLUMNS)]
+        copies = rng.random(n_users) < 1 / 3
+        picks[copies] = picks[rng.integers(0, n_users, copies.sum())]
+        race_df = pd.DataFrame(drivers[picks], columns=utils.PREDICTION_COLUMNS)
+        race_df.insert(0, 'Race', race)
+        race_df.insert(0, 'Name', [f"User {i}" for i in range(n_users)])
+        frames.append(race_df)
+        classified = rng.permutation(N_DRIVERS)[:N_DRIVERS - N_UNCLASSIFIED]
+        results[round] = {'MRData': {'RaceTable': {'Races': [{'round': str(round), 'Results': [
+            {'position': str(position), 'Driver': {'givenName': 'Driver', 'familyName': f"{driver:02d}"}}
+            for position, driver in enumerate(classified, start=1)]}]}}}
+    schedule_payload = {'MRData': {'RaceTable': {'Races': [
+        {'round': str(round), 'raceName': race, 'date': f"2000-{(round - 1) // 2 + 1:02d}-{(round - 1) % 2 * 14 + 1:02d}",
+         'time': '14:00:00Z', 'Circuit': {'circuitName': f"Circuit {round}"}}
+        for round, race in enumerate(races, start=1)]}}}
+    return pd.concat(frames, ignore_index=True), schedule_payload, results
+
+def install_fixtures(predictions_df, schedule_payload, season_results):
+    """Points utils at an in-memory S3 holding the predictions and an F1 API cache holding the season."""
+    s3_client = InMemoryS3()
+    utils.get_s3_client = lambda: s3_client
+    f1_api.response_cache = f1_api.ResponseCache(':memory:')
+    f1_api.response_cache.put(utils.SCHEDULE_URL.format(season=BENCH_LEAGUE.season), json.dumps(schedule_payload),
+                              None, None, None)
+    for round, payload in season_results.items():
+        f1_api.response_cache.put(utils.RESULTS_URL.format(season=BENCH_LEAGUE.season, round=round),
+                                  json.dumps(payload), None, None, None)
+    for cached in [utils._league_data, utils.load_predictions, utils.load_schedule, utils.fetch_race_results,
+                   utils.fetch_season_results]:
+        cached.clear()
+    utils.league_data(BENCH_LEAGUE).partitioned_store.save(predictions_df)
+
+def stages(predictions_df, season_results):
+    """Returns [(stage name, rows processed, callable)] for one synthetic season."""
+    race_frames = dict(tuple(predictions_df.groupby('Race', sort=False)))
+    race_results = {race: utils.race_results_frame(utils.parse_race_results(season_results[round]))
+                    for round, race in enumerate(race_frames, start=1)}
+    first_race = next(iter(race_frames))
+    sample = race_frames[first_race].head(PER_USER_SAMPLE)
+    n_predictions = len(predictions_df)
+    tied_scores = [pd.DataFrame({'Predictor': race_df['Name'].to_numpy(),
+                                 'Score': np.random.default_rng(0).integers(0, 60, len(race_df))})
+                   for race_df in race_frames.values()]
+    race_list, race_dict = list(race_frames), {race: round for round, race in enumerate(race_frames, start=1)}
+
+    def calculate_scores():
+        for _, user_predictions in sample.groupby('Name', sort=False):
+            utils.calculate_scores(user_predictions, race_results[first_race])
+
+    def get_all_user_scores():
+        return [utils.get_all_user_scores(race_frames[race], race_results[race]) for race in race_frames]
+
+    def apply_f1_scoring():
+        return [utils.apply_f1_scoring(scores) for scores in tied_scores]
+
+    def score_race_tables():
+        return {race: utils.score_race_table(race_frames[race], race_results[race]) for race in race_frames}
+
+    tables = score_race_tables()
+
+    def season_standings():
+        season = standings.SeasonStandings()
+        for race in race_list:
+            season.apply_race(race, tables[race])
+        season.frames()
+        return season.table()
+
+    def season_standings_end_to_end():
+        # Through S3 and the F1 API fixtures, from an empty standings object each time
+        utils.league_data(BENCH_LEAGUE).standings_store.invalidate()
+        utils.get_s3_client().delete_object(Bucket=None, Key=utils.league_data(BENCH_LEAGUE).standings_file)
+        return utils.get_season_standings(race_list, race_dict, BENCH_LEAGUE).table()
+
+    return [
+        ('calculate_scores (per user)', len(sample), calculate_scores),
+        ('get_all_user_scores', n_predictions, get_all_user_scores),
+        ('apply_f1_scoring', n_predictions, apply_f1_scoring),
+        ('score_race_table', n_predictions, score_race_tables),
+        ('standings', n_predictions, season_standings),
+        ('standings end to end', n_predictions, season_standings_end_to_end),
+    ]
+
+def measure(func, repeat):
+    """Returns (best seconds over repeat runs, peak traced MB of one more run, its result)."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 2**20, result
+
+def run_size(n_users, n_rounds, repeat):
+    """Benchmarks one league size. Returns {'stages': {name: numbers}, 'checksum': ...}."""
+    predictions_df, schedule_payload, season_results = synthetic_season(n_users, n_rounds)
+    install_fixtures(predictions_df, schedule_payload, season_results)
+    report = {'stages': {}}
+    outputs = {}
+    for name, rows, func in stages(predictions_df, season_results):
+        seconds, peak_mb, outputs[name] = measure(func, repeat)
+        report['stages'][name] = {'seconds': round(seconds, 6), 'rows_per_second': round(rows / seconds),
+                                  'peak_mb': round(peak_mb, 2)}
+    # The in-memory and S3-backed paths have to agree before their numbers mean anything
+    pd.testing.assert_frame_equal(outputs['standings'], outputs['standings end to end'])
+    report['checksum'] = storage.fingerprint(outputs['standings'])
+    return report
+
+def compare(size, report, baseline, tolerance):
+    """Returns the list of regressions of report against baseline."""
+    failures = []
+    if report['checksum'] != baseline.get('checksum'):
+        failures.append(f"{size} users: standings checksum changed, the scores are different")
+    for name, numbers in report['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if base is None:
+            continue
+        for metric in ['seconds', 'peak_mb']:
+            if numbers[metric] > base[metric] * (1 + tolerance) and numbers[metric] - base[metric] > 0.01:
+                failures.append(f"{size} users: {name} {metric} {numbers[metric]} vs baseline {base[metric]}")
+    return failures
+
+def run_startup(repeat):
+    """Returns {'stages': {step: {'seconds'}}, 'loaded': [...]}, the median of repeat cold starts."""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', f"LAZY_MODULES = {LAZY_MODULES!r}\n{STARTUP_SCRIPT}"],
+                                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+                                check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {'stages': {step: {'seconds': round(float(np.median([run['steps'][step] for run in runs])), 4)}
+                       for step in runs[0]['steps']},
+            'loaded': sorted({module for run in runs for module in run['loaded']})}
+
+def compare_startup(report, baseline, tolerance):
+    failures = [f"startup: the login page loaded {module}, which should only load on first use"
+                for module in report['loaded']]
+    for step, numbers in report['stages'].items():
+        base = (baseline or {}).get('stages', {}).get(step)
+        if base and numbers['seconds'] > base['seconds'] * (1 + tolerance) and numbers['seconds'] - base['seconds'] > 0.05:
+            failures.append(f"startup: {step} took {numbers['seconds']}s vs baseline {base['seconds']}s")
+    return failures
+
+def startup(args, baselines):
+    report = run_startup(max(args.repeat, 5))
+    baseline = baselines.get('startup')
+    print("Cold start (cumulative, median of fresh interpreters)")
+    for step, numbers in report['stages'].items():
+        base = (baseline or {}).get('stages', {}).get(step)
+        change = f"{numbers['seconds'] / base['seconds'] - 1:+7.0%}" if base and base['seconds'] else "    new"
+        print(f"  {step:<30}{numbers['seconds']:10.4f}s {change}")
+    print(f"  loaded by the login page: {', '.join(report['loaded']) or 'none of ' + ', '.join(LAZY_MODULES)}")
+    if args.update_baselines:
+        baselines['startup'] = report
+        return []
+    return compare_startup(report, baseline, args.tolerance)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark scoring, ranking and standings on synthetic seasons")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="Numbers of predictors to run")
+    parser.add_argument('--rounds', type=int, default=24, help="Rounds per season (default: 24)")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per stage, the best is kept (default: 3)")
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help="Allowed slowdown/memory growth over the baseline (default: 0.3 = 30%%)")
+    parser.add_argument('--baselines', default=BASELINES_FILE, help="Baselines file")
+    parser.add_argument('--update-baselines', action='store_true', help="Save the results as the new baselines")
+    parser.add_argument('--startup', action='store_true', help="Benchmark a cold start instead of scoring")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+    key_prefix = f"{args.rounds} rounds/"
+
+    failures = []
+    for size in ([] if args.startup else args.sizes):
+        report = run_size(size, args.rounds, args.repeat)
+        baseline = baselines.get(f"{key_prefix}{size}")
+        print(f"{size} predictors x {args.rounds} rounds")
+        for name, numbers in report['stages'].items():
+            base = (baseline or {}).get('stages', {}).get(name)
+            change = f"{numbers['seconds'] / base['seconds'] - 1:+7.0%}" if base and base['seconds'] else "    new"
+            print(f"  {name:<30}{numbers['seconds']:10.4f}s {change}  {numbers['rows_per_second']:>12,} rows/s"
+                  f"  {numbers['peak_mb']:9.2f} MB peak")
+        if baseline is not None:
+            failures += compare(size, report, baseline, args.tolerance)
+        if args.update_baselines:
+            baselines[f"{key_prefix}{size}"] = report
+    if args.startup:
+        failures += startup(args, baselines)
+
+    if args.update_baselines:
+        with open(args.baselines, 'w') as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+        print(f"Saved baselines to {args.baselines}")
+        return 0
+    if failures:
+        print("REGRESSIONS:", file=sys.stderr)
+        for failure in failures:
+            print(f"  {failure}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
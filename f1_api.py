@@ -0,0 +1,290 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+import requests
+import metrics
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Local file that keeps API responses between app restarts, unless F1_API_CACHE says otherwise
+DEFAULT_CACHE_PATH = os.path.join('.cache', 'f1_api.sqlite3')
+
+# How long (in seconds) each kind of response stays fresh before it is revalidated
+SCHEDULE_TTL = 60 * 60          # race calendar, can move around during the season
+DRIVERS_TTL = 60 * 60           # entry list for an upcoming race
+RESULTS_TTL = 5 * 60            # results endpoint before official results are published
+
+# Upper bound on parallel requests to the API, also the size of the connection pool
+MAX_CONNECTIONS = 8
+
+# Every request gets the same (connect, read) timeout so a stalled API can't hang a page
+REQUEST_TIMEOUT = (3.05, 10)
+
+# Longest Retry-After (in seconds) we wait for before retrying, so a rate limited
+# API can't stall a page for as long as it asks
+MAX_RETRY_AFTER = 5
+
+class CappedRetry(Retry):
+    """Retry that honours Retry-After, but never waits longer than MAX_RETRY_AFTER."""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
+# Retry rate limiting and server errors a few times with exponential backoff,
+# honouring (a capped) Retry-After when the API sends it
+RETRY_POLICY = CappedRetry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                           allowed_methods=frozenset(['GET']), respect_retry_after_header=True,
+                           raise_on_status=False)
+
+# One pooled, keep-alive session shared by every caller (requests sessions are
+# safe to share across threads for plain GETs)
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS, max_retries=RETRY_POLICY))
+session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS, max_retries=RETRY_POLICY))
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of calling the API while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """
+    Stops calling the API for reset_timeout seconds after failure_threshold
+    consecutive failures. Once the timeout has passed a single trial request
+    is let through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'open':
+                return False
+            if self.state == 'half-open':
+                # Let one trial request through and hold everyone else back
+                self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+breaker = CircuitBreaker()
+
+class ResponseCache:
+    """
+    Persistent store of API responses keyed by URL, backed by SQLite.
+    Each entry keeps the raw body, the validators the server sent (ETag and
+    Last-Modified) and an expiry time. An expiry of None means the entry is
+    permanent and is never fetched again.
+    path: SQLite file, by default F1_API_CACHE (read on first use, once .env is loaded)
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def _conn(self):
+        # Opened on first use, always with self._lock held
+        if self._connection is None:
+            self.path = self.path or os.getenv('F1_API_CACHE') or DEFAULT_CACHE_PATH
+            try:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                connection = sqlite3.connect(self.path, check_same_thread=False)
+            except (OSError, sqlite3.Error):
+                # Read-only filesystem: keep the cache for the life of the process only
+                connection = sqlite3.connect(':memory:', check_same_thread=False)
+            with connection:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS responses (
+                        url TEXT PRIMARY KEY,
+                        body TEXT NOT NULL,
+                        etag TEXT,
+                        last_modified TEXT,
+                        fetched_at REAL NOT NULL,
+                        expires_at REAL
+                    )""")
+            self._connection = connection
+        return self._connection
+
+    def get(self, url):
+        """Returns the cached entry for url as a dict, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at, expires_at FROM responses WHERE url = ?",
+                (url,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['body', 'etag', 'last_modified', 'fetched_at', 'expires_at'], row))
+
+    def put(self, url, body, etag, last_modified, expires_at):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (url, body, etag, last_modified, time.time(), expires_at))
+
+    def touch(self, url, expires_at):
+        """Marks an entry as fresh again after a 304 Not Modified."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE responses SET fetched_at = ?, expires_at = ? WHERE url = ?",
+                (time.time(), expires_at, url))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+response_cache = ResponseCache()
+
+# Cache counters, shared by every session in this process
+_stats_lock = threading.Lock()
+cache_stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'refetched': 0, 'stale': 0}
+
+# Per-endpoint request latencies, keeping the most recent samples for percentiles
+latency_stats = {}
+
+def _count(key):
+    with _stats_lock:
+        cache_stats[key] += 1
+    metrics.incr(f'api.cache_{key}')
+
+def get_cache_stats():
+    """Returns a snapshot of the hit/miss counters."""
+    with _stats_lock:
+        return dict(cache_stats)
+
+def _endpoint(url):
+    """Short endpoint name for stats, e.g. 'races', 'drivers', 'results' or 'laps'."""
+    segments = [segment for segment in urlparse(url).path.split('/') if segment]
+    # Skip trailing numbers (laps/12/), so every lap counts towards the same endpoint
+    while len(segments) > 1 and segments[-1].isdigit():
+        segments.pop()
+    return segments[-1] if segments else ''
+
+def _record_latency(url, seconds, error):
+    with _stats_lock:
+        stats = latency_stats.setdefault(_endpoint(url), {'calls': 0, 'errors': 0, 'samples': deque(maxlen=500)})
+        stats['calls'] += 1
+        stats['errors'] += int(error)
+        stats['samples'].append(seconds * 1000)
+    metrics.record_span(f'api.{_endpoint(url)}', seconds, error)
+    metrics.incr('api.calls')
+
+def get_latency_stats():
+    """
+    Returns {endpoint: {'calls', 'errors', 'avg_ms', 'p95_ms', 'max_ms'}} for every
+    endpoint called so far. Cache hits are not API calls and are not included.
+    """
+    with _stats_lock:
+        snapshot = {endpoint: (stats['calls'], stats['errors'], sorted(stats['samples']))
+                    for endpoint, stats in latency_stats.items()}
+    return {endpoint: {'calls': calls,
+                       'errors': errors,
+                       'avg_ms': round(sum(samples) / len(samples), 1),
+                       'p95_ms': round(samples[int(0.95 * (len(samples) - 1))], 1),
+                       'max_ms': round(samples[-1], 1)}
+            for endpoint, (calls, errors, samples) in snapshot.items() if samples}
+
+def _expiry(ttl, final):
+    if final or ttl is None:
+        return None
+    return time.time() + ttl
+
+def _is_outage(error):
+    """True for failures that mean the API is unavailable, not that the request was bad."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, requests.RequestException)
+
+def _request(url, headers):
+    """Single timed GET through the shared session, raising on HTTP errors other than 304."""
+    if not breaker.allow():
+        raise CircuitOpenError(f"F1 API circuit breaker is open, not calling {url}")
+    start = time.perf_counter()
+    try:
+        response = session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code != 304:
+            response.raise_for_status()
+    except requests.RequestException as e:
+        _record_latency(url, time.perf_counter() - start, error=True)
+        if _is_outage(e):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+    _record_latency(url, time.perf_counter() - start, error=False)
+    breaker.record_success()
+    return response
+
+def get_json(url, ttl, is_final=None):
+    """
+    Returns the parsed JSON response for url, served from the local cache while fresh.
+    ttl: seconds a response stays fresh, None to cache it permanently
+    is_final: optional callable(data) returning True once the payload can no longer
+    change (e.g. published results), in which case it is cached permanently
+    Stale entries are revalidated with If-None-Match/If-Modified-Since, so an
+    unchanged response costs a 304 instead of a full download. If the API is down
+    (or the circuit breaker is open) the last good cached payload is served instead.
+    Raises requests exceptions when the API fails and nothing is cached.
+    """
+    entry = response_cache.get(url)
+    if entry is not None and (entry['expires_at'] is None or entry['expires_at'] > time.time()):
+        _count('hits')
+        return json.loads(entry['body'])
+
+    headers = {}
+    if entry is not None:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    try:
+        response = _request(url, headers)
+    except requests.RequestException as e:
+        if entry is None or not _is_outage(e):
+            raise
+        # Serve the last good payload; it stays stale so the next call retries
+        _count('stale')
+        return json.loads(entry['body'])
+
+    if response.status_code == 304 and entry is not None:
+        _count('revalidated')
+        data = json.loads(entry['body'])
+        response_cache.touch(url, _expiry(ttl, is_final is not None and is_final(data)))
+        return data
+
+    _count('misses' if entry is None else 'refetched')
+    data = response.json()
+    response_cache.put(url, response.text, response.headers.get('ETag'),
+                       response.headers.get('Last-Modified'),
+                       _expiry(ttl, is_final is not None and is_final(data)))
+    return data
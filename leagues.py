@@ -0,0 +1,73 @@
+"""
+Leagues and seasons.
+
+Every league's data for a season lives under its own S3 prefix, so a page for
+one league only ever reads that league's objects:
+
+    leagues/{season}/{league}/predictions/...    per-race predictions
+    leagues/{season}/{league}/submissions/...    pending submissions
+    leagues/{season}/{league}/snapshots/...      per-race scoring tables
+    leagues/{season}/{league}/standings.json     running standings
+    leagues/{season}/{league}/analytics.npz      prediction analytics cube
+    leagues/{league}/participants.csv            members (shared across seasons)
+
+The original league keeps using the keys from .env (PREDICTIONS_FILE,
+PARTICIPANTS_FILE, ...), so existing data does not move. LEAGUES_INDEX lists
+every (season, league) the deployment hosts.
+"""
+import json
+import os
+from collections import namedtuple
+from urllib.parse import quote
+
+League = namedtuple('League', ['season', 'name'])
+
+# Settings are read when they are used rather than on import, which happens
+# before the entry points have loaded .env
+
+def default_league():
+    """The league (and season) the deployment started with, backed by the .env keys."""
+    return League(os.getenv('F1_SEASON') or '2025', os.getenv('F1_LEAGUE') or 'main')
+
+def leagues_prefix():
+    return os.getenv('LEAGUES_PREFIX') or 'leagues/'
+
+def index_key():
+    """S3 key of the index of hosted leagues."""
+    return os.getenv('LEAGUES_INDEX') or f'{leagues_prefix()}index.json'
+
+def storage_keys(league):
+    """Returns the S3 keys and prefixes for one league's season."""
+    if league == default_league():
+        return {
+            'predictions_file': os.getenv('PREDICTIONS_FILE'),
+            'predictions_prefix': os.getenv('PREDICTIONS_PREFIX'),
+            'submissions_prefix': os.getenv('SUBMISSIONS_PREFIX') or 'submissions/',
+            'snapshots_prefix': os.getenv('SNAPSHOTS_PREFIX') or 'snapshots/',
+            'standings_file': os.getenv('STANDINGS_FILE') or 'standings.json',
+            'analytics_file': os.getenv('ANALYTICS_FILE') or 'analytics.npz',
+            'participants_file': os.getenv('PARTICIPANTS_FILE'),
+        }
+    season_prefix = f"{leagues_prefix()}{league.season}/{quote(league.name, safe='')}/"
+    return {
+        'predictions_file': f'{season_prefix}predictions.csv',
+        # New leagues start out with per-race partitions
+        'predictions_prefix': f'{season_prefix}predictions/',
+        'submissions_prefix': f'{season_prefix}submissions/',
+        'snapshots_prefix': f'{season_prefix}snapshots/',
+        'standings_file': f'{season_prefix}standings.json',
+        'analytics_file': f'{season_prefix}analytics.npz',
+        'participants_file': f"{leagues_prefix()}{quote(league.name, safe='')}/participants.csv",
+    }
+
+def parse_index(body):
+    """Parses the leagues index object into a list of Leagues."""
+    entries = json.loads(body.read()).get('leagues', [])
+    return [League(str(entry['season']), entry['name']) for entry in entries]
+
+def index_body(leagues):
+    return json.dumps({'leagues': [{'season': league.season, 'name': league.name}
+                                   for league in sorted(set(leagues))]})
+
+def label(league):
+    return f"{league.name} ({league.season})"
@@ -0,0 +1,215 @@
+"""
+Provisional scoring while a race is running.
+
+A position feed reports the running order as {position: driver} after each
+lap. LiveRace polls one feed on a single background thread for every session
+watching the race, and LiveScorer rescores only the picks of drivers whose
+position changed, using an index from each driver to the users who picked them.
+Viewers read the last ranked table; they never poll or score anything themselves.
+
+Feeds have a poll() method returning (lap, {position: driver}) for the newest
+running order, or None if there is nothing new, and a finished attribute.
+"""
+import json
+import threading
+import time
+import numpy as np
+import pandas as pd
+import f1_api
+import metrics
+
+class ApiPositionFeed:
+    """
+    Running order from the F1 API lap timings, one lap at a time.
+    laps_url: URL template with a {lap} placeholder for one lap's timings
+    drivers_url: the round's drivers endpoint, used to turn driverIds into names
+    results_url: the round's results endpoint, the feed is finished once the
+    official results are in
+    Laps that were published are final and cached permanently, a lap that is not
+    out yet is asked for again at most every ttl seconds.
+    """
+
+    def __init__(self, laps_url, drivers_url, results_url, ttl=10):
+        self.laps_url = laps_url
+        self.drivers_url = drivers_url
+        self.results_url = results_url
+        self.ttl = ttl
+        self.lap = 0
+        self.finished = False
+        self._names = None
+
+    def _driver_names(self):
+        if self._names is None:
+            data = f1_api.get_json(self.drivers_url, ttl=f1_api.DRIVERS_TTL)
+            self._names = {driver['driverId']: f"{driver['givenName']} {driver['familyName']}"
+                           for driver in data['MRData']['DriverTable']['Drivers']}
+        return self._names
+
+    def _timings(self, lap):
+        data = f1_api.get_json(self.laps_url.format(lap=lap), ttl=self.ttl,
+                               is_final=lambda data: bool(_laps(data)))
+        laps = _laps(data)
+        return laps[0].get('Timings', []) if laps else None
+
+    def _results_published(self):
+        data = f1_api.get_json(self.results_url, ttl=self.ttl, is_final=lambda data: bool(_results(data)))
+        return bool(_results(data))
+
+    def poll(self):
+        # Catch up on every lap published since the last poll, only the newest order matters
+        order = None
+        while True:
+            timings = self._timings(self.lap + 1)
+            if timings is None:
+                break
+            self.lap += 1
+            names = self._driver_names()
+            order = {int(timing['position']): names.get(timing['driverId'], timing['driverId'])
+                     for timing in timings}
+        if order is None:
+            # No new lap: the race is over once the official results are out
+            self.finished = self._results_published()
+            return None
+        return self.lap, order
+
+def _laps(data):
+    races = data.get('MRData', {}).get('RaceTable', {}).get('Races', [])
+    return races[0].get('Laps', []) if races else []
+
+def _results(data):
+    races = data.get('MRData', {}).get('RaceTable', {}).get('Races', [])
+    return races[0].get('Results', []) if races else []
+
+class ReplayFeed:
+    """
+    Replays recorded running orders, laps_per_poll laps per poll, e.g. to
+    rehearse a race weekend or when the API has no live timings.
+    laps: list of (lap, {position: driver}) in lap order
+    """
+
+    def __init__(self, laps, laps_per_poll=1):
+        self.laps = laps
+        self.laps_per_poll = laps_per_poll
+        self._next = 0
+
+    @property
+    def finished(self):
+        return self._next >= len(self.laps)
+
+    @classmethod
+    def from_file(cls, path, laps_per_poll=1):
+        """Reads a JSON file of [{"lap": 1, "order": ["Driver in P1", "Driver in P2", ...]}, ...]."""
+        with open(path) as f:
+            recorded = json.load(f)
+        return cls([(entry['lap'], {position: driver for position, driver in enumerate(entry['order'], start=1)})
+                    for entry in recorded], laps_per_poll)
+
+    def poll(self):
+        if self.finished:
+            return None
+        self._next = min(self._next + self.laps_per_poll, len(self.laps))
+        return self.laps[self._next - 1]
+
+class LiveScorer:
+    """
+    Per-pick points for one race's predictions against a changing running order.
+    Same points as the official scoring (max(0, 10 - |real - predicted|), 0 for
+    drivers that are not running in a scored position).
+    codes: prediction_codes.PredictionCodes holding the race's predictions
+    """
+
+    def __init__(self, codes, race):
+        users, picks = codes.race_picks(race)
+        self.users = codes.decode_users(users)
+        self.pick_points = np.zeros(picks.shape, dtype='int64')
+        self.scores = np.zeros(len(users), dtype='int64')
+        self.positions = {}
+        # driver -> (rows of the users who picked them, column of the pick)
+        rows, cols = np.nonzero(picks >= 0)
+        drivers = picks[rows, cols]
+        self._index = {codes.drivers[code]: (rows[picked], cols[picked])
+                       for code, picked in pd.Series(drivers).groupby(drivers).indices.items()}
+
+    def update(self, order):
+        """
+        Moves to a new running order ({position: driver}), rescoring only the picks
+        of drivers whose position changed. Returns the number of picks rescored.
+        """
+        positions = {driver: position for position, driver in order.items()}
+        changed = [driver for driver in set(self.positions) | set(positions)
+                   if self.positions.get(driver) != positions.get(driver) and driver in self._index]
+        rescored = 0
+        for driver in changed:
+            rows, cols = self._index[driver]
+            real = positions.get(driver)
+            points = (np.maximum(0, 10 - np.abs(real - (cols + 1))) if real is not None
+                      else np.zeros(len(rows), dtype='int64'))
+            np.add.at(self.scores, rows, points - self.pick_points[rows, cols])
+            self.pick_points[rows, cols] = points
+            rescored += len(rows)
+        self.positions = positions
+        return rescored
+
+    def user_scores(self):
+        """Returns DataFrame with columns: Predictor, Score"""
+        return pd.DataFrame({'Predictor': self.users, 'Score': self.scores})
+
+class LiveRace:
+    """
+    One race's provisional scores, kept up to date by a single polling thread
+    shared by every viewer. The thread starts on the first read and stops once
+    the feed is finished or nobody has read the scores for idle_timeout seconds;
+    the next read starts it again.
+    scorer: LiveScorer for the race's predictions
+    rank: callable(user_scores_df) run once per change, e.g. apply_f1_scoring
+    """
+
+    def __init__(self, feed, scorer, rank, poll_interval=15, idle_timeout=300):
+        self.feed = feed
+        self.scorer = scorer
+        self.rank = rank
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.lap = None
+        self.order = {}
+        self.table = None
+        self.updated_at = None
+        self.error = None
+        self._read_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def snapshot(self):
+        """Returns (lap, running order, ranked table or None before the first lap, last error or None)."""
+        with self._lock:
+            self._read_at = time.monotonic()
+            if not self.feed.finished and (self._worker is None or not self._worker.is_alive()):
+                self._worker = threading.Thread(target=self._run, name='live-race', daemon=True)
+                self._worker.start()
+            return self.lap, self.order, self.table, self.error
+
+    def poll(self):
+        """Polls the feed once and rescores if the running order moved. Returns True if it did."""
+        with metrics.span('live.poll'):
+            update = self.feed.poll()
+        if update is None:
+            return False
+        lap, order = update
+        with metrics.span('live.rescore'):
+            metrics.incr('live.picks_rescored', self.scorer.update(order))
+            table = self.rank(self.scorer.user_scores())
+        with self._lock:
+            self.lap, self.order, self.table, self.updated_at = lap, order, table, time.time()
+        return True
+
+    def _run(self):
+        while not self.feed.finished and time.monotonic() - self._read_at < self.idle_timeout:
+            try:
+                self.poll()
+                self.error = None
+            except Exception as e:
+                # Keep the last good table and try again on the next interval
+                metrics.incr('live.poll_errors')
+                self.error = e
+            if not self.feed.finished:
+                time.sleep(self.poll_interval)
@@ -0,0 +1,141 @@
+"""
+Admin commands for the F1 WPC data in S3.
+
+    python manage.py migrate-predictions     # CSV -> one Parquet object per race
+    python manage.py export-predictions-csv  # Parquet partitions -> CSV for reading by hand
+    python manage.py compact-submissions     # fold pending submissions into the predictions store
+    python manage.py rebuild-standings       # recompute the season standings and check the incremental ones
+    python manage.py add-league              # register a league/season in the leagues index
+    python manage.py hash-passwords          # replace plaintext passwords in the participants file with hashes
+    python manage.py set-password USERNAME   # set one participant's password
+
+Every command works on the original league unless --season/--league are given.
+
+Uses the same .env settings as the app (S3_BUCKET_NAME, PREDICTIONS_FILE, PREDICTIONS_PREFIX,
+SUBMISSIONS_PREFIX).
+"""
+import argparse
+import getpass
+import os
+import sys
+from io import StringIO
+import pandas as pd
+import leagues
+import participants
+import storage
+import utils
+
+def _league(args):
+    return leagues.League(args.season, args.league)
+
+def _prefix(args):
+    return args.prefix or leagues.storage_keys(_league(args))['predictions_prefix'] or 'predictions/'
+
+def migrate_predictions(args):
+    store = storage.PartitionedPredictionsStore(utils.get_s3_client(), os.getenv('S3_BUCKET_NAME'), _prefix(args))
+    counts = storage.migrate_csv_to_partitions(utils.get_s3_client(), os.getenv('S3_BUCKET_NAME'),
+                                               utils.league_data(_league(args)).predictions_file, store)
+    for race, rows in counts.items():
+        print(f"{race}: {rows} predictions -> {store.partition_key(race)}")
+    print(f"Migrated {sum(counts.values())} predictions for {len(counts)} races. "
+          f"Set PREDICTIONS_PREFIX={_prefix(args)} to start using them.")
+
+def export_predictions_csv(args):
+    store = storage.PartitionedPredictionsStore(utils.get_s3_client(), os.getenv('S3_BUCKET_NAME'), _prefix(args))
+    store.export_csv(args.key)
+    print(f"Exported predictions for {len(store.races())} races to {args.key}")
+
+def compact_submissions(args):
+    compacted = utils.compact_submissions(args.race or None, _league(args))
+    print(f"Compacted {compacted} submissions")
+
+def rebuild_standings(args):
+    league = _league(args)
+    race_list, race_dict = utils.get_race_list(league.season)
+    rebuilt, differences = utils.rebuild_standings(race_list, race_dict, league)
+    print(f"Rebuilt standings for {len(rebuilt.users)} users over {len(rebuilt.races)} races")
+    if differences:
+        print("Incremental standings did not match the rebuild:")
+        for difference in differences:
+            print(f"  {difference}")
+        return 1
+    print("Incremental standings matched the rebuild")
+    return 0
+
+def add_league(args):
+    registered = utils.register_league(_league(args))
+    print("Hosted leagues: " + ", ".join(leagues.label(league) for league in registered))
+
+def _read_participants(league):
+    key = utils.league_data(league).participants_file
+    body = utils.get_s3_client().get_object(Bucket=os.getenv('S3_BUCKET_NAME'), Key=key)['Body']
+    return key, pd.read_csv(body, dtype=str)
+
+def _write_participants(league, key, participants_df):
+    csv_buffer = StringIO()
+    participants_df.to_csv(csv_buffer, index=False)
+    utils.get_s3_client().put_object(Bucket=os.getenv('S3_BUCKET_NAME'), Key=key, Body=csv_buffer.getvalue())
+    utils.league_data(league).participant_directory.invalidate()
+
+def hash_passwords(args):
+    league = _league(args)
+    key, participants_df = _read_participants(league)
+    participants_df, hashed = participants.hash_participants(participants_df)
+    _write_participants(league, key, participants_df)
+    print(f"Hashed {hashed} passwords in {key}; the file no longer has a Password column")
+
+def set_password(args):
+    league = _league(args)
+    key, participants_df = _read_participants(league)
+    rows = participants_df['Username'] == args.username
+    if not rows.any():
+        print(f"No participant {args.username!r} in {key}")
+        return 1
+    password = getpass.getpass(f"New password for {args.username}: ")
+    participants_df, _ = participants.hash_participants(participants_df)
+    participants_df.loc[rows, 'PasswordHash'] = participants.hash_password(password)
+    if args.hint is not None:
+        participants_df.loc[rows, 'Hint'] = args.hint
+    _write_participants(league, key, participants_df)
+    print(f"Updated the password for {args.username} in {key}")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Admin commands for the F1 WPC data in S3")
+    parser.add_argument('--season', default=leagues.default_league().season, help="Season to work on")
+    parser.add_argument('--league', default=leagues.default_league().name, help="League to work on")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    migrate = commands.add_parser('migrate-predictions', help="Split the predictions CSV into per-race Parquet objects")
+    migrate.add_argument('--prefix', help="S3 key prefix for the per-race objects (default: the league's)")
+    migrate.set_defaults(func=migrate_predictions)
+
+    export = commands.add_parser('export-predictions-csv', help="Write all per-race objects back out as one CSV")
+    export.add_argument('--prefix', help="S3 key prefix of the per-race objects (default: the league's)")
+    export.add_argument('--key', default=os.getenv('PREDICTIONS_EXPORT_FILE') or 'predictions_export.csv',
+                        help="S3 key of the exported CSV")
+    export.set_defaults(func=export_predictions_csv)
+
+    compact = commands.add_parser('compact-submissions', help="Fold pending submissions into the predictions store")
+    compact.add_argument('--race', action='append', help="Only compact this race (repeatable)")
+    compact.set_defaults(func=compact_submissions)
+
+    rebuild = commands.add_parser('rebuild-standings', help="Recompute the season standings from every race")
+    rebuild.set_defaults(func=rebuild_standings)
+
+    add = commands.add_parser('add-league', help="Register --league/--season in the leagues index")
+    add.set_defaults(func=add_league)
+
+    hash_cmd = commands.add_parser('hash-passwords', help="Convert plaintext passwords in the participants file to salted hashes")
+    hash_cmd.set_defaults(func=hash_passwords)
+
+    password_cmd = commands.add_parser('set-password', help="Set a participant's password (prompts for it)")
+    password_cmd.add_argument('username', help="Participant's Username")
+    password_cmd.add_argument('--hint', help="Also replace their password hint")
+    password_cmd.set_defaults(func=set_password)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
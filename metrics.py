@@ -0,0 +1,199 @@
+"""
+Timing spans and counters for the app's hot paths.
+
+    with metrics.render('Standings'):     # one page run
+        ...
+        with metrics.span('score.race_table'):
+            ...
+        metrics.incr('s3.bytes', n)
+
+    @metrics.timed('io.results')
+    def fetch_race_results(...): ...
+
+Every span and counter is added to the process-wide totals and, while a page
+is running, to that render's breakdown (spans nest, so a render's spans can
+add up to more than its total). Renders are kept for the diagnostics page and
+each finished one is also logged as a JSON line on the 'f1wpc.metrics' logger.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger('f1wpc.metrics')
+
+# Recent per-render breakdowns kept in memory, and latency samples kept per span for percentiles
+RECENT_RENDERS = 200
+SPAN_SAMPLES = 500
+
+_lock = threading.Lock()
+counters = {}
+spans = {}
+renders = deque(maxlen=RECENT_RENDERS)
+
+# The render the current code runs for; copied into worker threads with contextvars.copy_context()
+_current_render = contextvars.ContextVar('render', default=None)
+
+class Render:
+    """Span times and counters for one run of a page."""
+
+    def __init__(self, page):
+        self.page = page
+        self.started_at = time.time()
+        self.seconds = None
+        self.spans = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            calls, total = self.spans.get(name, (0, 0.0))
+            self.spans[name] = (calls + 1, total + seconds)
+
+    def incr(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            return {'page': self.page,
+                    'started_at': self.started_at,
+                    'ms': round(self.seconds * 1000, 1) if self.seconds is not None else None,
+                    'spans': {name: {'calls': calls, 'ms': round(total * 1000, 1)}
+                              for name, (calls, total) in self.spans.items()},
+                    'counters': dict(self.counters)}
+
+def record_span(name, seconds, error=False):
+    """Adds one timed call of span name."""
+    with _lock:
+        stats = spans.setdefault(name, {'calls': 0, 'errors': 0, 'total': 0.0, 'samples': deque(maxlen=SPAN_SAMPLES)})
+        stats['calls'] += 1
+        stats['errors'] += int(error)
+        stats['total'] += seconds
+        stats['samples'].append(seconds * 1000)
+    current = _current_render.get()
+    if current is not None:
+        current.add_span(name, seconds)
+
+def incr(name, value=1):
+    """Adds value to counter name."""
+    with _lock:
+        counters[name] = counters.get(name, 0) + value
+    current = _current_render.get()
+    if current is not None:
+        current.incr(name, value)
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record_span(name, time.perf_counter() - start, error)
+
+def timed(name):
+    """Decorator recording every call of the function as span name."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def render(page):
+    """Collects the spans and counters of one page run into a Render."""
+    current = Render(page)
+    token = _current_render.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        _current_render.reset(token)
+        with _lock:
+            renders.append(current)
+        logger.info(json.dumps(current.to_dict()))
+
+def current_render():
+    return _current_render.get()
+
+def get_span_stats():
+    """Returns {span: {'calls', 'errors', 'total_ms', 'avg_ms', 'p95_ms', 'max_ms'}}."""
+    with _lock:
+        snapshot = {name: (stats['calls'], stats['errors'], stats['total'], sorted(stats['samples']))
+                    for name, stats in spans.items()}
+    return {name: {'calls': calls,
+                   'errors': errors,
+                   'total_ms': round(total * 1000, 1),
+                   'avg_ms': round(total * 1000 / calls, 1),
+                   'p95_ms': round(samples[int(0.95 * (len(samples) - 1))], 1),
+                   'max_ms': round(samples[-1], 1)}
+            for name, (calls, errors, total, samples) in snapshot.items() if samples}
+
+def get_counters():
+    with _lock:
+        return dict(counters)
+
+def get_recent_renders():
+    """Returns the kept renders as dicts, newest first."""
+    with _lock:
+        kept = list(renders)
+    return [kept_render.to_dict() for kept_render in reversed(kept)]
+
+def json_lines():
+    """The kept renders as structured log lines, oldest first."""
+    return "\n".join(json.dumps(kept) for kept in reversed(get_recent_renders()))
+
+def _metric_name(name):
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+def prometheus_text():
+    """The process totals in the Prometheus text exposition format."""
+    lines = []
+    for name, value in sorted(get_counters().items()):
+        metric = f"f1wpc_{_metric_name(name)}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    lines += ["# TYPE f1wpc_span_seconds summary"]
+    for name, stats in sorted(get_span_stats().items()):
+        lines += [f'f1wpc_span_seconds{{span="{name}",quantile="0.95"}} {stats["p95_ms"] / 1000:g}',
+                  f'f1wpc_span_seconds_sum{{span="{name}"}} {stats["total_ms"] / 1000:g}',
+                  f'f1wpc_span_seconds_count{{span="{name}"}} {stats["calls"]}']
+    lines += ["# TYPE f1wpc_span_errors_total counter"]
+    for name, stats in sorted(get_span_stats().items()):
+        lines.append(f'f1wpc_span_errors_total{{span="{name}"}} {stats["errors"]}')
+    return "\n".join(lines) + "\n"
+
+def instrument_s3(s3_client):
+    """Times every call made through a boto3 S3 client and counts calls and bytes downloaded."""
+    def before_call(context, **kwargs):
+        context['metrics_start'] = time.perf_counter()
+
+    def after_call(context, http_response, parsed, model, **kwargs):
+        status = http_response.status_code if http_response is not None else None
+        record_span(f's3.{model.name}', time.perf_counter() - context.get('metrics_start', time.perf_counter()),
+                    error=status is None or (status >= 400))
+        incr('s3.calls')
+        if status == 304:
+            incr('s3.not_modified')
+        if model.name == 'GetObject' and status == 200:
+            incr('s3.bytes', parsed.get('ContentLength') or 0)
+
+    s3_client.meta.events.register('before-call.s3', before_call)
+    s3_client.meta.events.register('after-call.s3', after_call)
+    return s3_client
+
+def reset():
+    with _lock:
+        counters.clear()
+        spans.clear()
+        renders.clear()
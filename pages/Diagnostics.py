@@ -0,0 +1,60 @@
+import streamlit as st
+import pandas as pd
+import utils
+import metrics
+import f1_api
+
+# Only admins (ADMIN_USERS in .env) can see the diagnostics
+if "authenticated" not in st.session_state or not st.session_state["authenticated"]:
+    st.warning("Please log in first!")
+    st.stop()  # Stop execution if not authenticated
+if not utils.is_admin():
+    st.error("This page is only available to admins.")
+    st.stop()
+
+# Function to show where the time goes in this server process
+def diagnostics_page():
+    st.title("Diagnostics")
+    st.markdown("Timings and counters for this server process since it started. Spans nest, so a render's spans can add up to more than its total.")
+
+    renders = metrics.get_recent_renders()
+    st.subheader("Recent renders")
+    if renders:
+        pages = sorted({render['page'] for render in renders})
+        page = st.selectbox("Page", ["All"] + pages)
+        shown = [render for render in renders if page == "All" or render['page'] == page]
+        breakdown = pd.DataFrame([{'Page': render['page'],
+                                   'Started': pd.Timestamp(render['started_at'], unit='s', tz='UTC'),
+                                   'Total ms': render['ms'],
+                                   **{f"{name} ms": span['ms'] for name, span in render['spans'].items()},
+                                   **render['counters']}
+                                  for render in shown])
+        st.dataframe(breakdown, use_container_width=True)
+    else:
+        st.info("No renders recorded yet.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Spans")
+        span_stats = metrics.get_span_stats()
+        st.dataframe(pd.DataFrame.from_dict(span_stats, orient='index').sort_values('total_ms', ascending=False)
+                     if span_stats else pd.DataFrame(), use_container_width=True)
+    with col2:
+        st.subheader("Counters")
+        st.dataframe(pd.Series(metrics.get_counters(), name='Value', dtype='int64').sort_index(),
+                     use_container_width=True)
+
+    st.subheader("F1 API")
+    st.dataframe(pd.DataFrame.from_dict(f1_api.get_latency_stats(), orient='index'), use_container_width=True)
+    st.write(f"Circuit breaker: {f1_api.breaker.state}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Download Prometheus metrics", metrics.prometheus_text(),
+                           file_name="metrics.prom", mime="text/plain", use_container_width=True)
+    with col2:
+        st.download_button("Download render logs (JSON lines)", metrics.json_lines(),
+                           file_name="renders.jsonl", mime="application/json", use_container_width=True)
+
+# Show the diagnostics page
+diagnostics_page()
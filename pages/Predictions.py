@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 import utils
+import metrics
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
@@ -13,15 +14,20 @@ if "authenticated" not in st.session_state or not st.session_state["authenticate
 def predictions_page():
     st.title("Make Your Predictions")
     st.markdown("Enter your predictions here! You can also edit past predictions, as long as it's before the scheduled race start time.")
-    race_list,race_dict = utils.get_race_list()
+    # One parsed schedule serves the race list, start times and the default race
+    schedule = utils.get_schedule()
+    race_list,race_dict = schedule.names(),schedule.race_dict()
 
     name = st.text_input("Enter your name",value=st.session_state.user,disabled=True)
-    race_location = st.selectbox("Select the race", race_list)  # Replace with actual race locations
+    # Default to the race that is coming up next
+    next_race = schedule.next_race()
+    race_location = st.selectbox("Select the race", race_list,
+                                 index=race_list.index(next_race.name) if next_race else 0)
 
-    # Get the race start time from the F1 API
-    race_start_time = utils.get_race_start_time(race_location)
-    race_start_time_et = race_start_time.replace(tzinfo=timezone.utc).astimezone(ZoneInfo("America/Toronto"))
+    # Race start time from the schedule, timezone-aware UTC
+    race_start_time = schedule.start_time(race_location)
     if race_start_time:
+        race_start_time_et = race_start_time.astimezone(ZoneInfo("America/Toronto"))
         st.write(f"The race start time for {race_location} is {race_start_time_et.strftime('%A %b %d, %I:%M %p')} (Eastern Time).")
     else:
         st.error(f"Could not retrieve race start time for {race_location}.")
@@ -32,10 +38,8 @@ def predictions_page():
     if len(drivers)==0:
         st.error("The drivers participating in this race have not yet been confirmed. Come back and try again later.")
     else:
-        # Read previous predictions
-        predictions_df = utils.read_predictions_from_s3()
-        user_predictions = predictions_df[(predictions_df['Name'] == name) & (predictions_df['Race'] == race_location)]
-        user_predictions = user_predictions.drop_duplicates(subset='Race',keep='last').reset_index(drop=True)
+        # Read previous predictions, decoded for this user only
+        user_predictions = utils.get_prediction_codes([race_location]).user_picks(name, race_location)
 
         col1, col2 = st.columns(2)
 
@@ -44,30 +48,31 @@ def predictions_page():
             st.write("Make your predictions for the top 10 drivers:")
             previous_predictions = [""] * 10  # Initialize with empty values if no previous predictions exist
 
-            if not user_predictions.empty:
+            if user_predictions is not None:
                 # If previous predictions exist, use them
-                previous_predictions = user_predictions.iloc[0][['P1', 'P2', 'P3', 'P4', 'P5', 'P6', 'P7', 'P8', 'P9', 'P10']].tolist()
+                previous_predictions = user_predictions
 
             predictions = [st.selectbox(f"Predicted P{i+1}", 
                                         drivers, 
-                                        index=drivers.index(previous_predictions[i]) if previous_predictions[i] else 0) for i in range(10)]
+                                        index=drivers.index(previous_predictions[i]) if previous_predictions[i] in drivers else 0) for i in range(10)]
             
         with col2:
             # Display the existing predictions if available
-            if not user_predictions.empty:
+            if user_predictions is not None:
                 st.write("Your previously submitted predictions:")
                 st.write("")
-                st.dataframe(user_predictions[['P1', 'P2', 'P3', 'P4', 'P5', 'P6', 'P7', 'P8', 'P9', 'P10']].T.rename(columns={0:'Driver'}))
+                st.dataframe(pd.DataFrame({'Driver': user_predictions}, index=utils.PREDICTION_COLUMNS))
 
         # Check if the current time is before the race start time
-        current_time = datetime.now()
+        current_time = datetime.now(timezone.utc)
         if current_time > race_start_time:
             st.error("The race has already started. You can no longer submit or edit predictions.")
             return
 
         if st.button("Submit Predictions"):
-            # Update the predictions with new data
+            # Acknowledged once saved, the receipt's time is what counts for the race start
             utils.update_predictions(predictions, name, race_location)
 
 # Show the predictions page
-predictions_page()
+with metrics.render('Predictions'):
+    predictions_page()
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 import utils
+import metrics
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 import requests
@@ -15,27 +16,31 @@ if "authenticated" not in st.session_state or not st.session_state["authenticate
 def results_page():
     st.title("Race Results and Predictions")
     st.markdown("Select a race to see the results!")
-    race_list,race_dict = utils.get_race_list()
+    league = utils.select_season()
+    race_list,race_dict = utils.get_race_list(league.season)
     race_location = st.selectbox("Select the race", race_list)
     # st.info("More stats coming soon!")
-    try:
-        race_results = pd.DataFrame([utils.get_race_results(race_dict[race_location])])
-        race_results = race_results.T.rename(columns={0:'Driver'})
-    except:
-        race_results = pd.DataFrame()
-    predictions_df = utils.read_predictions_from_s3()
-    user_predictions = predictions_df[((predictions_df['Race']==race_location)&
-                                       (predictions_df['Name']==st.session_state.user))]
+    race_results_dict = utils.get_race_results(race_dict[race_location], league.season)
+    race_results = utils.race_results_frame(race_results_dict)
+    # Scoring table for this race, computed once and then reused until anything changes
+    snapshot = utils.get_race_snapshot(race_location, race_dict[race_location],
+                                       race_results_dict=race_results_dict, league=league)
+    user_predictions = (utils.snapshot_user_table(snapshot, st.session_state.user)
+                        if snapshot is not None else pd.DataFrame())
 
-    if race_results.empty:
+    current_race = utils.get_schedule(league.season).current_race()
+    if snapshot is None and current_race is not None and current_race.name == race_location:
+        # No official results yet, but the race is on: show the provisional scores instead
+        live_results(race_location, race_dict[race_location], league)
+        return
+    elif snapshot is None:
         st.error(f"Could not retrieve race results for the {race_location}. Check back again later.")
         return
     elif user_predictions.empty:
         st.error(f"No predictions found for {st.session_state.user}. Did you forget to submit them?")
         return
     else:
-        user_predictions = utils.calculate_scores(user_predictions, race_results)
-        all_scores = utils.get_all_user_scores(predictions_df[predictions_df['Race'] == race_location], race_results)
+        all_scores = snapshot[['Predictor', 'Score', 'Points', 'Place']]
         # Find user's row
         user_row = all_scores[all_scores['Predictor'] == st.session_state.user].iloc[0]
         st.markdown(
@@ -69,5 +74,39 @@ def results_page():
             group_table = all_scores[['Place', 'Predictor', 'Score', 'Points']].set_index('Place')
             st.dataframe(group_table, use_container_width=True)
 
+        # Pick statistics from the precomputed analytics cube
+        cube = utils.get_prediction_cube(race_list, race_dict, league)
+        if race_location in cube.races:
+            with st.expander(label="Group picks for this race", expanded=False):
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.markdown("**Consensus Picks**")
+                    st.dataframe(cube.consensus(race_location), use_container_width=True)
+                with col2:
+                    st.markdown("**Most Picked Drivers**")
+                    st.dataframe(cube.popularity(race_location), use_container_width=True)
+
+# Function to show the provisional scores of a running race, refreshed every poll
+@st.fragment(run_every=utils.LIVE_POLL)
+def live_results(race_location, round, league):
+    live_race = utils.get_live_race(race_location, round, league)
+    if live_race is None:
+        return
+    lap, order, live_table, error = live_race.snapshot()
+    if error is not None:
+        st.warning(f"Live positions are delayed: {error}")
+    if live_table is None:
+        st.info(f"The official results for the {race_location} are not out yet and there are no live positions so far. Check back again later.")
+        return
+    st.markdown(f"**Provisional scores after lap {lap}.** They change with the running order until the official results are published.")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Running Order**")
+        st.dataframe(pd.DataFrame({'Driver': order}).sort_index(), width='stretch')
+    with col2:
+        st.markdown("**Provisional Group Scores**")
+        st.dataframe(live_table[['Place', 'Predictor', 'Score', 'Points']].set_index('Place'), use_container_width=True)
+
 # Show the results page
-results_page()
+with metrics.render('Results'):
+    results_page()
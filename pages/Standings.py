@@ -1,8 +1,6 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
 import utils
-import plotly.graph_objects as go
+import metrics
 
 # Check if the user is authenticated before showing any content
 if "authenticated" not in st.session_state or not st.session_state["authenticated"]:
@@ -12,81 +10,65 @@ if "authenticated" not in st.session_state or not st.session_state["authenticate
 
 def standings_page():
     st.title("Season Standings")
-    predictions_df = utils.read_predictions_from_s3()
-    race_list, race_dict = utils.get_race_list()
-    all_f1_points = pd.DataFrame()
-    all_places = pd.DataFrame()
-    for race in race_list:
-        if race in predictions_df.Race.unique():
-            race_results_dict = utils.get_race_results(race_dict[race])
-            # If there are no official results yet for this race, skip it
-            if not race_results_dict:
-                continue
-            race_results = pd.DataFrame([race_results_dict])
-            race_results = race_results.T.rename(columns={0: 'Driver'})
-            race_scores = utils.get_all_user_scores(predictions_df[predictions_df['Race'] == race], race_results)
-            # F1 points table
-            race_points = race_scores[['Predictor', 'Points']].set_index('Predictor').rename(columns={'Points': race})
-            all_f1_points = pd.concat([all_f1_points, race_points], axis=1)
-            # Place table for tiebreakers
-            race_places = race_scores[['Predictor', 'Place']].set_index('Predictor').rename(columns={'Place': race})
-            all_places = pd.concat([all_places, race_places], axis=1)
-    all_f1_points = all_f1_points.fillna(0)
-    all_places = all_places.fillna(0).astype(int)
+    league = utils.select_season()
+    race_list, race_dict = utils.get_race_list(league.season)
+    # Running standings, only races finalized since the last render are applied
+    season_standings = utils.get_season_standings(race_list, race_dict, league)
+    all_scores, all_f1_points, all_places, cumsum_df = season_standings.frames()
 
-    # Count number of P1 finishes for each user
-    p1_counts = (all_places == 1).sum(axis=1)
-    # Count number of podiums (P1, P2, P3) for each user
-    podium_counts = ((all_places == 1) | (all_places == 2) | (all_places == 3)).sum(axis=1)
-
-    # Build standings DataFrame with tiebreakers: Points, P1, Podiums
-    standings_df = (
-        all_f1_points.sum(axis=1)
-        .to_frame('Points')
-        .assign(P1=p1_counts, Podiums=podium_counts)
-        .sort_values(
-            by=['Points', 'P1', 'Podiums'],
-            ascending=[False, False, False]
-        )
-        .reset_index()
-        .rename(columns={'Predictor': 'User'})
-    )
-
-    # Set index as P1, P2, P3, ...
-    standings_df.index = [f'P{i+1}' for i in range(len(standings_df))]
+    # Standings with tiebreakers: Points, P1, Podiums
+    standings_df = season_standings.table()
 
     # Order for legends: championship order
     champ_order = standings_df['User'].tolist()
 
-    # Show race prediction scores (not F1 points) for each race
-    all_scores = pd.DataFrame()
-    for race in race_list:
-        if race in predictions_df.Race.unique():
-            race_results_dict = utils.get_race_results(race_dict[race])
-            if not race_results_dict:
-                continue
-            race_results = pd.DataFrame([race_results_dict])
-            race_results = race_results.T.rename(columns={0: 'Driver'})
-            race_scores = utils.get_all_user_scores(predictions_df[predictions_df['Race'] == race], race_results)
-            race_score_vals = race_scores[['Predictor', 'Score']].set_index('Predictor').rename(columns={'Score': race})
-            all_scores = pd.concat([all_scores, race_score_vals], axis=1)
-    all_scores = all_scores.fillna(0)
-
-
-    st.info(f"""The season is {round(all_f1_points.shape[1]/len(race_list)*100,1)}% done. So far,
-            **{standings_df.iloc[0,0]}** is leading with **{standings_df.iloc[0,1]}** points, ahead of
-            {standings_df.iloc[1,0]} and {standings_df.iloc[2,0]} with {standings_df.iloc[1,1]}
-            and {standings_df.iloc[2,1]} points, respectively.""")
+    # The summary needs a scored race, and names the chasers only if there are two of them
+    if all_f1_points.shape[1] == 0 or standings_df.empty:
+        st.info("No races have been scored yet this season.")
+    elif len(standings_df) < 3:
+        st.info(f"""The season is {round(all_f1_points.shape[1]/len(race_list)*100,1)}% done. So far,
+                **{standings_df.iloc[0,0]}** is leading with **{standings_df.iloc[0,1]}** points.""")
+    else:
+        st.info(f"""The season is {round(all_f1_points.shape[1]/len(race_list)*100,1)}% done. So far,
+                **{standings_df.iloc[0,0]}** is leading with **{standings_df.iloc[0,1]}** points, ahead of
+                {standings_df.iloc[1,0]} and {standings_df.iloc[2,0]} with {standings_df.iloc[1,1]}
+                and {standings_df.iloc[2,1]} points, respectively.""")
     st.dataframe(standings_df, use_container_width=True)
 
+    with st.expander(label="Who can still win?", expanded=False):
+        simulation_df = utils.simulate_championship(race_list, race_dict, league)
+        if simulation_df is not None:
+            st.markdown(f"""Title chances from {utils.SIMULATED_SEASONS:,} simulated seasons, assuming everyone
+                        keeps their latest predictions for the remaining races. **Points to clinch** is how many
+                        more points make you champion whatever anyone else scores, and is blank when the
+                        remaining races can't give you enough to clinch on your own.""")
+            st.dataframe(simulation_df.assign(**{'Title chance': (simulation_df['Title chance'] * 100).round(1)})
+                         .rename(columns={'Title chance': 'Title chance (%)'}), use_container_width=True)
+
     with st.expander(label="Full season points table", expanded=False):
         st.dataframe(all_f1_points.loc[champ_order], use_container_width=True)
 
     with st.expander(label="Full season race scores table", expanded=False):
         st.dataframe(all_scores.loc[champ_order], use_container_width=True)
 
+    # Season pick statistics from the precomputed analytics cube
+    cube = utils.get_prediction_cube(race_list, race_dict, league)
+    with st.expander(label="Head to head and pick statistics", expanded=False):
+        if st.session_state.user in cube.users:
+            st.markdown(f"**Your Head to Head Record ({st.session_state.user})**")
+            st.dataframe(cube.head_to_head(st.session_state.user), use_container_width=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**Contrarian Scores** (share of the group that picked differently)")
+            st.dataframe(cube.contrarian_scores(), use_container_width=True)
+        with col2:
+            st.markdown("**Most Picked Drivers**")
+            st.dataframe(cube.popularity(), use_container_width=True)
+
+    # Only needed for the charts, so the tables above don't wait for it
+    import plotly.graph_objects as go
+
     fig = go.Figure()
-    cumsum_df = all_f1_points.cumsum(axis=1)
     for user in champ_order:
         if user in cumsum_df.index:
             row = cumsum_df.loc[user]
@@ -124,4 +106,5 @@ def standings_page():
     )
     st.plotly_chart(fig)
         
-standings_page()
+with metrics.render('Standings'):
+    standings_page()
@@ -0,0 +1,136 @@
+"""
+Participant directory: the league members from PARTICIPANTS_FILE, loaded once
+into a dict keyed by username.
+
+The file is a CSV with columns Username, Name, Hint and PasswordHash, where
+PasswordHash is a salted PBKDF2 hash from hash_password. Files that still have
+a plaintext Password column keep working until they are converted with
+`python manage.py hash-passwords`.
+"""
+import base64
+import functools
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import namedtuple
+import pandas as pd
+
+Participant = namedtuple('Participant', ['username', 'name', 'hint', 'password_hash'])
+
+HASH_ALGORITHM = 'pbkdf2_sha256'
+HASH_ITERATIONS = 200_000
+
+# Plaintext passwords from unconverted files are kept with this prefix so they
+# go through the same constant-time comparison as hashes
+PLAINTEXT_PREFIX = 'plain$'
+
+def hash_password(password, salt=None, iterations=HASH_ITERATIONS):
+    """Returns 'pbkdf2_sha256$iterations$salt$hash' for password, with a random salt by default."""
+    salt = salt or base64.b64encode(os.urandom(16)).decode()
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations)
+    return f"{HASH_ALGORITHM}${iterations}${salt}${base64.b64encode(digest).decode()}"
+
+def verify_password(password, password_hash):
+    """Checks password against a hash_password result in constant time."""
+    if password_hash.startswith(PLAINTEXT_PREFIX):
+        return hmac.compare_digest(password.encode(), password_hash[len(PLAINTEXT_PREFIX):].encode())
+    try:
+        algorithm, iterations, salt, _ = password_hash.split('$')
+        iterations = int(iterations)
+    except ValueError:
+        # Malformed hash, e.g. edited by hand
+        return False
+    if algorithm != HASH_ALGORITHM or iterations < 1:
+        return False
+    return hmac.compare_digest(hash_password(password, salt, iterations).encode(), password_hash.encode())
+
+# Checked when the username is unknown, so a login attempt takes as long either way.
+# Computed on the first such login rather than at import
+@functools.lru_cache(maxsize=None)
+def _dummy_hash():
+    return hash_password('', salt='dummy')
+
+def _text(value):
+    return '' if pd.isna(value) else str(value)
+
+def parse_participants(body):
+    """Parses the participants CSV into {username: Participant}."""
+    participants_df = pd.read_csv(body, dtype=str)
+    directory = {}
+    for row in participants_df.to_dict('records'):
+        username = _text(row.get('Username'))
+        if not username:
+            continue
+        password_hash = _text(row.get('PasswordHash'))
+        if not password_hash and _text(row.get('Password')):
+            password_hash = PLAINTEXT_PREFIX + _text(row.get('Password'))
+        if not password_hash:
+            continue
+        directory[username] = Participant(username, _text(row.get('Name')), _text(row.get('Hint')), password_hash)
+    return directory
+
+def hash_participants(participants_df):
+    """
+    Returns (participants_df with a PasswordHash column and no Password column,
+    number of passwords hashed). Rows that already have a hash keep it.
+    """
+    participants_df = participants_df.copy()
+    if 'PasswordHash' not in participants_df.columns:
+        participants_df['PasswordHash'] = ''
+    participants_df['PasswordHash'] = participants_df['PasswordHash'].fillna('')
+    hashed = 0
+    if 'Password' in participants_df.columns:
+        for i, password in participants_df['Password'].items():
+            if not participants_df.at[i, 'PasswordHash'] and not pd.isna(password):
+                participants_df.at[i, 'PasswordHash'] = hash_password(str(password))
+                hashed += 1
+        participants_df = participants_df.drop(columns='Password')
+    return participants_df, hashed
+
+class ParticipantDirectory:
+    """
+    In-process copy of one league's participants.
+    The S3 object is revalidated by ETag (see storage.CachedS3Object) at most
+    once every refresh_interval seconds, so logins in between never touch S3
+    and the file is only re-parsed when it changed.
+    """
+
+    def __init__(self, participants_object, refresh_interval=60):
+        self.participants_object = participants_object
+        self.refresh_interval = refresh_interval
+        self._participants = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def participants(self):
+        """Returns {username: Participant}, raising on S3 errors if nothing was loaded yet."""
+        with self._lock:
+            if self._participants is None or time.monotonic() - self._checked_at >= self.refresh_interval:
+                try:
+                    self._participants = self.participants_object.get()
+                except Exception:
+                    if self._participants is None:
+                        raise
+                    # Keep logging people in with the copy we have, retry on the next interval
+                self._checked_at = time.monotonic()
+            return self._participants
+
+    def usernames(self):
+        return list(self.participants())
+
+    def get(self, username):
+        return self.participants().get(username)
+
+    def authenticate(self, username, password):
+        """Returns the Participant if password is theirs, else None."""
+        participant = self.get(username)
+        password_hash = participant.password_hash if participant is not None else _dummy_hash()
+        if verify_password(password or '', password_hash) and participant is not None:
+            return participant
+        return None
+
+    def invalidate(self):
+        with self._lock:
+            self._participants = None
@@ -0,0 +1,104 @@
+"""
+Compact in-process representation of predictions.
+
+Instead of a DataFrame holding a driver name string in every P1-P10 cell and
+repeating Name and Race on every row, PredictionCodes encodes races, users and
+drivers as small integer codes:
+
+    picks[race, user, k]  driver code of the user's pick for position k + 1,
+                          -1 if they did not predict the race (int8, or int16
+                          once there are more than 127 drivers)
+    races, users, drivers decode tables, code -> name
+
+As everywhere in the scoring, only a user's first submission per race counts.
+The rows' original order within each race is kept, so decoded frames (and the
+ties ranked from them) come out in the same order as the source DataFrame.
+"""
+import numpy as np
+import pandas as pd
+
+class PredictionCodes:
+    """Predictions as a dense (races, users, positions) array of driver codes."""
+
+    def __init__(self, races, users, drivers, picks, order, columns):
+        self.races = races
+        self.users = users
+        self.drivers = drivers
+        self.picks = picks
+        # Row number in the source frame per (race, user), -1 if they did not predict it
+        self.order = order
+        self.columns = columns
+        self._race_index = {race: i for i, race in enumerate(races)}
+        self._user_index = {user: i for i, user in enumerate(users)}
+
+    @classmethod
+    def from_frame(cls, predictions_df, columns):
+        """Encodes a DataFrame with columns Name, Race and columns (P1-P10)."""
+        if predictions_df.empty or 'Race' not in predictions_df.columns:
+            return cls([], [], [], np.full((0, 0, len(columns)), -1, dtype='int8'),
+                       np.zeros((0, 0), dtype='int32'), list(columns))
+        predictions_df = (predictions_df.dropna(subset=['Name', 'Race'])
+                          .drop_duplicates(subset=['Name', 'Race'], keep='first'))
+        race_codes, races = pd.factorize(predictions_df['Race'])
+        user_codes, users = pd.factorize(predictions_df['Name'])
+        driver_codes, drivers = pd.factorize(predictions_df[columns].to_numpy().ravel())
+        dtype = 'int8' if len(drivers) < np.iinfo('int8').max else 'int16'
+        picks = np.full((len(races), len(users), len(columns)), -1, dtype=dtype)
+        picks[race_codes, user_codes] = driver_codes.reshape(len(predictions_df), len(columns))
+        order = np.full((len(races), len(users)), -1, dtype='int32')
+        order[race_codes, user_codes] = np.arange(len(predictions_df))
+        return cls(list(races), list(users), list(drivers), picks, order, list(columns))
+
+    def __len__(self):
+        """Number of (user, race) predictions."""
+        return int((self.order >= 0).sum())
+
+    @property
+    def nbytes(self):
+        return self.picks.nbytes + self.order.nbytes
+
+    def has_race(self, race):
+        return race in self._race_index
+
+    def race_users(self, race):
+        """Returns the user codes that predicted race, in their original order."""
+        order = self.order[self._race_index[race]]
+        predicted = np.flatnonzero(order >= 0)
+        return predicted[np.argsort(order[predicted], kind='stable')]
+
+    def race_picks(self, race):
+        """Returns (user codes, their (users, positions) driver codes) for one race."""
+        if race not in self._race_index:
+            return np.zeros(0, dtype='int64'), np.zeros((0, len(self.columns)), dtype=self.picks.dtype)
+        users = self.race_users(race)
+        return users, self.picks[self._race_index[race]][users]
+
+    def user_picks(self, user, race):
+        """Returns the user's picks for race as a list of driver names, or None."""
+        if user not in self._user_index or race not in self._race_index:
+            return None
+        codes = self.picks[self._race_index[race], self._user_index[user]]
+        if self.order[self._race_index[race], self._user_index[user]] < 0:
+            return None
+        return [self.drivers[code] if code >= 0 else None for code in codes]
+
+    def decode_users(self, user_codes):
+        return np.asarray(self.users, dtype=object)[user_codes]
+
+    def decode_drivers(self, driver_codes):
+        """Names for an array of driver codes, None for -1."""
+        table = np.asarray(self.drivers + [None], dtype=object)
+        return table[driver_codes]
+
+    def to_frame(self, races=None):
+        """Decodes (some races of) the predictions back to a Name, Race, P1-P10 DataFrame in the original row order."""
+        race_codes = (np.arange(len(self.races)) if races is None
+                      else np.array([self._race_index[race] for race in races if race in self._race_index], dtype='int64'))
+        rows, users = np.nonzero(self.order[race_codes] >= 0)
+        rows = race_codes[rows]
+        sort = np.argsort(self.order[rows, users], kind='stable')
+        rows, users = rows[sort], users[sort]
+        predictions_df = pd.DataFrame(self.decode_drivers(self.picks[rows, users]), columns=self.columns)
+        predictions_df.insert(0, 'Race', np.asarray(self.races, dtype=object)[rows])
+        predictions_df.insert(0, 'Name', self.decode_users(users))
+        return predictions_df
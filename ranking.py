@@ -0,0 +1,53 @@
+import numpy as np
+
+def rank_descending(keys):
+    """
+    Tie-aware ranking, highest first, in O(n log n).
+    keys: array-like of shape (n,) or (n, k); with several columns the first is
+    the main key and later columns break ties in order (e.g. Points, P1, Podiums)
+    Returns: (order, places)
+        order: row indices sorted best first (fully tied rows keep their input order)
+        places: place of each row in that order, with min-rank ties, i.e. tied rows
+        share the best place and the next place(s) are skipped (1, 2, 2, 4, ...)
+    """
+    keys = np.asarray(keys)
+    if keys.ndim == 1:
+        keys = keys[:, None]
+    n = len(keys)
+    if n == 0:
+        return np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64')
+    # np.lexsort sorts by its last key first and is stable
+    order = np.lexsort(tuple(-keys[:, j] for j in reversed(range(keys.shape[1]))))
+    sorted_keys = keys[order]
+    starts_group = np.ones(n, dtype=bool)
+    starts_group[1:] = (sorted_keys[1:] != sorted_keys[:-1]).any(axis=1)
+    # Each row takes the position of the first row of its tie group
+    places = np.maximum.accumulate(np.where(starts_group, np.arange(1, n + 1), 0))
+    return order, places
+
+def places_to_points(places, scoring_dict):
+    """Maps places to points with scoring_dict ({place: points}) in one lookup; other places get 0."""
+    places = np.asarray(places, dtype='int64')
+    lookup = np.zeros(max(scoring_dict) + 2, dtype='int64')
+    for place, points in scoring_dict.items():
+        lookup[place] = points
+    return np.where((places > 0) & (places < len(lookup)), lookup[np.clip(places, 0, len(lookup) - 1)], 0)
+
+def rank_rows_descending(scores):
+    """
+    Min-rank places within each row of an integer array, highest first, e.g. every
+    simulated race of every simulated season at once.
+    scores: non-negative int array of shape (..., n)
+    Returns: int array of the same shape, same ties as rank_descending (1, 2, 2, 4, ...)
+    """
+    scores = np.asarray(scores, dtype='int64')
+    n = scores.shape[-1]
+    if n == 0:
+        return np.zeros(scores.shape, dtype='int64')
+    rows = scores.reshape(-1, n)
+    # Offset every row past the previous one so a single sorted array holds all rows in order
+    keys = rows + (np.arange(len(rows)) * (rows.max(initial=0) + 1))[:, None]
+    sorted_keys = np.sort(keys, axis=1).ravel()
+    row_ends = (np.arange(1, len(rows) + 1) * n)[:, None]
+    greater = row_ends - np.searchsorted(sorted_keys, keys, side='right')
+    return (greater + 1).reshape(scores.shape)
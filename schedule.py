@@ -0,0 +1,78 @@
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+# One race weekend from the F1 API schedule; start is a timezone-aware UTC datetime
+Race = namedtuple('Race', ['round', 'name', 'start', 'circuit', 'sprint'])
+
+# How long after the scheduled start a race counts as over (time to run and for results to settle)
+RACE_DURATION = timedelta(days=1)
+
+def parse_start(date, time=None):
+    """Returns the UTC start of a race from the API's date and (optional) time strings."""
+    # A few schedule entries have no start time yet, assume midnight UTC for those
+    return datetime.strptime(f"{date}T{time or '00:00:00Z'}", "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+
+class Schedule:
+    """
+    A season's race schedule, parsed once from a single F1 API payload.
+    Races are kept in round order with name -> round and round -> race indexes,
+    so lookups on the page hot path are dictionary reads, not scans.
+    """
+
+    def __init__(self, races):
+        self.races = sorted(races, key=lambda race: race.round)
+        self.round_of = {race.name: race.round for race in self.races}
+        self.by_round = {race.round: race for race in self.races}
+        self._starts = sorted(race.start for race in self.races)
+        self._by_start = sorted(self.races, key=lambda race: race.start)
+
+    @classmethod
+    def from_json(cls, data):
+        races = []
+        for race in data['MRData']['RaceTable']['Races']:
+            races.append(Race(round=int(race['round']),
+                              name=race['raceName'],
+                              start=parse_start(race['date'], race.get('time')),
+                              circuit=race.get('Circuit', {}).get('circuitName', ''),
+                              sprint='Sprint' in race))
+        return cls(races)
+
+    def __len__(self):
+        return len(self.races)
+
+    def names(self):
+        return [race.name for race in self.races]
+
+    def race_dict(self):
+        """Returns {race name: round}, the shape get_race_list has always returned."""
+        return dict(self.round_of)
+
+    def race(self, name):
+        """Returns the Race with this name, or None."""
+        return self.by_round.get(self.round_of.get(name))
+
+    def start_time(self, name):
+        race = self.race(name)
+        return race.start if race else None
+
+    def has_started(self, name, now=None):
+        start = self.start_time(name)
+        return start is not None and (now or datetime.now(timezone.utc)) >= start
+
+    def is_over(self, round, now=None):
+        race = self.by_round.get(int(round))
+        return race is not None and (now or datetime.now(timezone.utc)) > race.start + RACE_DURATION
+
+    def current_race(self, now=None):
+        """Returns the race that has started but is not over yet, or None."""
+        now = now or datetime.now(timezone.utc)
+        i = bisect_right(self._starts, now)
+        if i and now <= self._by_start[i - 1].start + RACE_DURATION:
+            return self._by_start[i - 1]
+        return None
+
+    def next_race(self, now=None):
+        """Returns the next race that has not started yet, or None after the last one."""
+        i = bisect_right(self._starts, now or datetime.now(timezone.utc))
+        return self._by_start[i] if i < len(self._by_start) else None
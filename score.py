@@ -0,0 +1,215 @@
+"""
+Headless scoring: recompute every race and the standings for whole seasons,
+outside Streamlit, with the same functions the pages use.
+
+    python score.py --output out/                                # the original league, from S3 + F1 API
+    python score.py --league 2024/office --league 2025/office    # several seasons/leagues in a process pool
+    python score.py --all-leagues --format parquet
+    python score.py --predictions predictions.csv --results results.json --format json
+    python score.py --dump-results results.json                  # archive the schedule and results for offline runs
+
+Predictions come from S3 (including pending submissions) or a local CSV/Parquet
+file. Schedule and results come from the F1 API (through the f1_api cache) or a
+JSON dump written by --dump-results: {"season": ..., "schedule": <schedule
+payload>, "results": {round: <results payload>}}.
+
+Writes, per league, under {output}/{season}/{league}/:
+    races/{round:02d}.{ext}   scoring table for each race (score_race_table)
+    points.{ext}              F1 points per user and race
+    standings.{ext}           season standings (SeasonStandings.table)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+import pandas as pd
+import f1_api
+import leagues
+import prediction_codes
+import schedule
+import standings
+import utils
+
+FORMATS = ['csv', 'parquet', 'json']
+
+class StageTimer:
+    """Collects wall-clock seconds per named stage, in the order they ran."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def __call__(self, name):
+        return _Stage(self, name)
+
+    def report(self):
+        return "\n".join(f"  {name:<20}{seconds:8.3f}s" for name, seconds in self.stages.items())
+
+class _Stage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.stages[self.name] = self.timer.stages.get(self.name, 0) + time.perf_counter() - self.start
+
+def read_predictions(league, path=None):
+    """
+    Returns the predictions as prediction_codes.PredictionCodes, from a local
+    CSV/Parquet file or from S3 with pending submissions.
+    """
+    if path:
+        predictions_df = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+        return prediction_codes.PredictionCodes.from_frame(predictions_df, utils.PREDICTION_COLUMNS)
+    # Unlike get_prediction_codes this raises instead of showing an error
+    return utils.load_predictions(league)
+
+def read_results_dump(path, season=None):
+    """
+    Returns (Schedule, {round: results payload}) from a --dump-results file.
+    Raises ValueError if the dump is of another season than season.
+    """
+    with open(path) as f:
+        dump = json.load(f)
+    if season is not None and str(dump['season']) != str(season):
+        raise ValueError(f"{path} holds the {dump['season']} season, not {season}")
+    return (schedule.Schedule.from_json(dump['schedule']),
+            {int(round): payload for round, payload in dump['results'].items()})
+
+def fetch_results(season, rounds):
+    """Returns {round: results payload} from the F1 API (through its cache), raising on errors."""
+    return {round: utils.fetch_race_results(round, season) for round in rounds}
+
+def dump_results(season, path):
+    """Writes the season's schedule and every published result to path."""
+    schedule_payload = f1_api.get_json(utils.SCHEDULE_URL.format(season=season), ttl=f1_api.SCHEDULE_TTL)
+    rounds = [race.round for race in schedule.Schedule.from_json(schedule_payload).races]
+    results = {str(round): payload for round, payload in fetch_results(season, rounds).items()
+               if utils.results_published(payload)}
+    with open(path, 'w') as f:
+        json.dump({'season': season, 'schedule': schedule_payload, 'results': results}, f)
+    return len(results)
+
+def score_season(codes, season_schedule, season_results):
+    """
+    Scores every race that has predictions and official results, in round order.
+    season_results: {round: results payload}
+    Returns: ({round: score_race_table DataFrame}, SeasonStandings)
+    """
+    race_tables = {}
+    season_standings = standings.SeasonStandings()
+    for race in season_schedule.races:
+        results_dict = utils.parse_race_results(season_results.get(race.round, {}))
+        if not codes.has_race(race.name) or not results_dict:
+            continue
+        race_tables[race.round] = utils.score_race_codes(codes, race.name, utils.race_results_frame(results_dict))
+        season_standings.apply_race(race.name, race_tables[race.round])
+    return race_tables, season_standings
+
+def write_frame(df, path, fmt, index=False):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if fmt == 'csv':
+        df.to_csv(path, index=index)
+    elif fmt == 'parquet':
+        df.to_parquet(path, index=index)
+    else:
+        (df.reset_index() if index else df).to_json(path, orient='records', indent=1)
+
+def score_league(league, output, fmt, predictions_path=None, results_path=None):
+    """Scores one league's season and writes its tables. Returns (league, StageTimer, summary line)."""
+    timer = StageTimer()
+    with timer("read predictions"):
+        codes = read_predictions(league, predictions_path)
+    with timer("read results"):
+        if results_path:
+            season_schedule, season_results = read_results_dump(results_path, league.season)
+        else:
+            season_schedule = utils.load_schedule(league.season)
+            rounds = [race.round for race in season_schedule.races if codes.has_race(race.name)]
+            season_results = fetch_results(league.season, rounds)
+    with timer("score races"):
+        race_tables, season_standings = score_season(codes, season_schedule, season_results)
+    with timer("standings"):
+        standings_df = season_standings.table()
+        _, points_df, _, _ = season_standings.frames()
+    with timer("write"):
+        league_dir = os.path.join(output, league.season, quote(league.name, safe=''))
+        for round, race_table in race_tables.items():
+            write_frame(race_table, os.path.join(league_dir, 'races', f'{round:02d}.{fmt}'), fmt)
+        write_frame(points_df, os.path.join(league_dir, f'points.{fmt}'), fmt, index=True)
+        write_frame(standings_df.rename_axis('Position'), os.path.join(league_dir, f'standings.{fmt}'), fmt, index=True)
+    summary = (f"{leagues.label(league)}: {len(race_tables)} races, {len(season_standings.users)} users "
+               f"-> {league_dir}")
+    return league, timer, summary
+
+def _parse_league(value):
+    season, _, name = value.partition('/')
+    if not name:
+        raise argparse.ArgumentTypeError(f"expected SEASON/LEAGUE, got {value!r}")
+    return leagues.League(season, name)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute race scores and standings outside the app")
+    parser.add_argument('--league', action='append', type=_parse_league, metavar='SEASON/LEAGUE',
+                        help="League to score (repeatable, default: the original league)")
+    parser.add_argument('--all-leagues', action='store_true', help="Score every league in the leagues index")
+    parser.add_argument('--predictions', help="Local predictions CSV/Parquet instead of S3 (one league only)")
+    parser.add_argument('--results', help="JSON dump from --dump-results instead of the F1 API (one league only)")
+    parser.add_argument('--dump-results', metavar='PATH', help="Only write the season's schedule and results to PATH")
+    parser.add_argument('--output', default='scores', help="Output directory (default: scores)")
+    parser.add_argument('--format', choices=FORMATS, default='csv', help="Output format (default: csv)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Processes used when scoring several leagues (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    league_list = args.league or [leagues.default_league()]
+    if args.all_leagues:
+        league_list = utils.list_leagues()
+    league_list = list(dict.fromkeys(league_list))
+
+    if args.dump_results:
+        if len(league_list) > 1:
+            parser.error("--dump-results takes a single season")
+        count = dump_results(league_list[0].season, args.dump_results)
+        print(f"Wrote the schedule and {count} results for {league_list[0].season} to {args.dump_results}")
+        return 0
+    if (args.predictions or args.results) and len(league_list) > 1:
+        parser.error("--predictions/--results only apply to a single league")
+    if args.results:
+        with open(args.results) as f:
+            dump_season = str(json.load(f)['season'])
+        if not args.league and not args.all_leagues:
+            # Score the dumped season rather than writing it under the default league's
+            league_list = [leagues.League(dump_season, league_list[0].name)]
+        elif league_list[0].season != dump_season:
+            parser.error(f"--results holds the {dump_season} season, not {league_list[0].season}")
+
+    start = time.perf_counter()
+    if len(league_list) == 1 or args.workers <= 1:
+        outcomes = [score_league(league, args.output, args.format, args.predictions, args.results)
+                    for league in league_list]
+    else:
+        # Each league is independent, so they are scored in parallel processes
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(league_list))) as executor:
+            futures = {league: executor.submit(score_league, league, args.output, args.format)
+                       for league in league_list}
+            outcomes = []
+            for league, future in futures.items():
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:
+                    # One bad league shouldn't lose the others' output
+                    print(f"{leagues.label(league)}: failed: {e}", file=sys.stderr)
+    for league, timer, summary in outcomes:
+        print(summary)
+        print(timer.report())
+    print(f"Scored {len(outcomes)} league(s) in {time.perf_counter() - start:.3f}s")
+    return 1 if len(outcomes) < len(league_list) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+What-if championship simulator: who can still win the league?
+
+Every simulated season samples a finishing order for each remaining round
+(Plackett-Luce, with driver strengths from their results so far), scores
+every user's likely predictions against it with the usual pick points, turns
+each race into F1 points like apply_f1_scoring and adds them to the current
+standings. Seasons are simulated in batches as NumPy arrays, optionally on a
+process pool; the same seed gives the same answer for any number of workers.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import ranking
+
+# A driver's log-strength drops by one for every POSITION_SCALE places of average finish
+POSITION_SCALE = 3.0
+
+# Upper bound on the (seasons x races x users x picks) block scored at once
+BATCH_CELLS = 5_000_000
+
+# Most points a user can earn in one race
+MAX_RACE_POINTS = 25
+
+# The state a simulation starts from:
+# users: list of usernames; points, p1, podiums: int arrays (users,) of the current standings
+# picks: int array (users, 10) of each user's likely picks as indices into strengths, -1 for none
+# strengths: float array (drivers,) of log-strengths, see driver_strengths
+# remaining: number of rounds still to be scored
+Season = namedtuple('Season', ['users', 'points', 'p1', 'podiums', 'picks', 'strengths', 'remaining'])
+
+def driver_strengths(season_results, drivers):
+    """
+    Log-strengths for drivers from their finishing positions so far.
+    season_results: iterable of {position: driver} dicts
+    Drivers without a result yet count as the worst average.
+    """
+    positions = {}
+    for race_results in season_results:
+        for position, driver in race_results.items():
+            positions.setdefault(driver, []).append(position)
+    averages = {driver: np.mean(driver_positions) for driver, driver_positions in positions.items()}
+    worst = max(averages.values(), default=len(drivers))
+    return -np.array([averages.get(driver, worst) for driver in drivers], dtype='float64') / POSITION_SCALE
+
+def simulate_batch(season, n_seasons, scoring_dict, seed):
+    """
+    Simulates n_seasons seasons. Returns (title counts, final points summed over
+    seasons), both float arrays (users,). A title shared after every tiebreaker
+    (points, then P1 finishes, then podiums) counts as a fraction for each.
+    """
+    rng = np.random.default_rng(seed)
+    n_drivers = len(season.strengths)
+    n_races = season.remaining
+    # Gumbel-max trick: sorting strength + Gumbel noise samples a Plackett-Luce order
+    order = np.argsort(-(season.strengths + rng.gumbel(size=(n_seasons, n_races, n_drivers))), axis=2)
+    positions = np.empty((n_seasons, n_races, n_drivers + 1), dtype='int64')
+    np.put_along_axis(positions, order, np.arange(1, n_drivers + 1), axis=2)
+    # Picks of unknown drivers (-1) point at the extra column and never score
+    positions[:, :, n_drivers] = n_drivers + 2 * season.picks.shape[1]
+    picks = np.where(season.picks >= 0, season.picks, n_drivers)
+
+    # (seasons, races, users, picks) -> race scores -> F1 points, same rules as a real race
+    predicted_pos = np.arange(1, picks.shape[1] + 1)
+    scores = np.maximum(0, 10 - np.abs(positions[:, :, picks] - predicted_pos)).sum(axis=3)
+    places = ranking.rank_rows_descending(scores)
+    points = season.points + ranking.places_to_points(places, scoring_dict).sum(axis=1)
+    p1 = season.p1 + (places == 1).sum(axis=1)
+    podiums = season.podiums + (places <= 3).sum(axis=1)
+
+    # Points first, then P1 finishes, then podiums, as in SeasonStandings.table
+    base = int(max(p1.max(initial=0), podiums.max(initial=0))) + 1
+    keys = (points * base + p1) * base + podiums
+    champions = keys == keys.max(axis=1, keepdims=True)
+    titles = (champions / champions.sum(axis=1, keepdims=True)).sum(axis=0)
+    return titles, points.sum(axis=0).astype('float64')
+
+def _simulate_batch(args):
+    return simulate_batch(*args)
+
+def simulate(season, scoring_dict, n_seasons=10000, seed=None, workers=None):
+    """
+    Runs n_seasons simulated seasons in batches of at most BATCH_CELLS cells.
+    workers: run the batches on a process pool of this size (in process by default)
+    Returns DataFrame indexed by User, best title chance first, with columns
+    Points, Max points, Expected points, Title chance (0-1), Eliminated and
+    Points to clinch (more points needed to be champion whatever anyone else scores,
+    NaN when that is more than the remaining races can give).
+    """
+    users = len(season.users)
+    cells = max(1, season.remaining * users * season.picks.shape[1])
+    batch_size = max(1, min(n_seasons, BATCH_CELLS // cells))
+    sizes = [batch_size] * (n_seasons // batch_size) + ([n_seasons % batch_size] if n_seasons % batch_size else [])
+    # One independent stream per batch, so the answer does not depend on the number of workers
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    batches = [(season, size, scoring_dict, batch_seed) for size, batch_seed in zip(sizes, seeds)]
+    if workers and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_batch, batches))
+    else:
+        results = [_simulate_batch(batch) for batch in batches]
+    titles = sum(result[0] for result in results)
+    final_points = sum(result[1] for result in results)
+
+    # Certain outcomes, from the most points anyone can still score
+    max_points = season.points + MAX_RACE_POINTS * season.remaining
+    # Everyone's best rival can reach the top maximum, except the user holding it
+    by_max = np.argsort(-max_points, kind='stable')
+    second = max_points[by_max[1]] if users > 1 else 0
+    best_other = np.where(np.arange(users) == by_max[0], second, max_points[by_max[0]])
+    to_clinch = np.maximum(0, best_other - season.points + 1)
+    simulation_df = pd.DataFrame({'Points': season.points,
+                                  'Max points': max_points,
+                                  'Expected points': (final_points / n_seasons).round(1),
+                                  'Title chance': (titles / n_seasons).round(4),
+                                  'Eliminated': max_points < season.points.max(initial=0),
+                                  'Points to clinch': np.where(to_clinch <= MAX_RACE_POINTS * season.remaining,
+                                                               to_clinch, np.nan)},
+                                 index=pd.Index(season.users, name='User'))
+    return simulation_df.sort_values(['Title chance', 'Points'], ascending=False)
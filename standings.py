@@ -0,0 +1,141 @@
+import json
+import numpy as np
+import pandas as pd
+import ranking
+
+class SeasonStandings:
+    """
+    Running season standings, updated one finalized race at a time.
+    Keeps the per-race (user x race) score, points and place matrices that the
+    Standings page displays, plus running totals, P1 counts, podium counts and
+    the cumulative points series, so applying a new race only touches that
+    race's column. Users are kept in the order they first appear.
+    """
+
+    def __init__(self):
+        self.races = []
+        self.users = []
+        self._user_index = {}
+        self.scores = np.zeros((0, 0), dtype='int64')
+        self.points = np.zeros((0, 0), dtype='int64')
+        self.places = np.zeros((0, 0), dtype='int64')
+        self.cumulative = np.zeros((0, 0), dtype='int64')
+        self.totals = np.zeros(0, dtype='int64')
+        self.p1 = np.zeros(0, dtype='int64')
+        self.podiums = np.zeros(0, dtype='int64')
+
+    def _add_users(self, users):
+        new_users = [user for user in users if user not in self._user_index]
+        if not new_users:
+            return
+        for user in new_users:
+            self._user_index[user] = len(self.users)
+            self.users.append(user)
+        # New users get 0 for every race applied before they first predicted
+        grow = ((0, len(new_users)), (0, 0))
+        self.scores = np.pad(self.scores, grow)
+        self.points = np.pad(self.points, grow)
+        self.places = np.pad(self.places, grow)
+        self.cumulative = np.pad(self.cumulative, grow)
+        self.totals = np.pad(self.totals, (0, len(new_users)))
+        self.p1 = np.pad(self.p1, (0, len(new_users)))
+        self.podiums = np.pad(self.podiums, (0, len(new_users)))
+
+    def apply_race(self, race, race_table):
+        """
+        Adds one race's results to the standings.
+        race_table: DataFrame with columns Predictor, Score, Points, Place for the race
+        (e.g. a race snapshot). Applying a race that is already included is a no-op.
+        """
+        if race in self.races:
+            return
+        self._add_users(race_table['Predictor'].tolist())
+        rows = np.array([self._user_index[user] for user in race_table['Predictor']], dtype='int64')
+        column = np.zeros((len(self.users), 3), dtype='int64')
+        column[rows] = race_table[['Score', 'Points', 'Place']].to_numpy(dtype='int64')
+        scores, points, places = column.T
+
+        self.races.append(race)
+        self.scores = np.column_stack([self.scores, scores])
+        self.points = np.column_stack([self.points, points])
+        self.places = np.column_stack([self.places, places])
+        self.totals = self.totals + points
+        self.p1 = self.p1 + (places == 1)
+        self.podiums = self.podiums + ((places >= 1) & (places <= 3))
+        self.cumulative = np.column_stack([self.cumulative, self.totals])
+
+    def _frame(self, values):
+        return pd.DataFrame(values, index=pd.Index(self.users, name='Predictor'), columns=list(self.races))
+
+    def frames(self):
+        """Returns (all_scores, all_f1_points, all_places, cumulative_points) as DataFrames."""
+        return (self._frame(self.scores), self._frame(self.points),
+                self._frame(self.places), self._frame(self.cumulative))
+
+    def table(self):
+        """
+        Returns the standings as a DataFrame with columns User, Points, P1, Podiums,
+        sorted with tiebreakers Points, then P1 finishes, then podiums, and
+        indexed P1, P2, P3, ...
+        """
+        order, _ = ranking.rank_descending(np.column_stack([self.totals, self.p1, self.podiums]))
+        standings_df = pd.DataFrame({'User': np.asarray(self.users, dtype=object)[order],
+                                     'Points': self.totals[order],
+                                     'P1': self.p1[order],
+                                     'Podiums': self.podiums[order]})
+        standings_df.index = [f'P{i+1}' for i in range(len(standings_df))]
+        return standings_df
+
+    def to_json(self):
+        return json.dumps({
+            'races': self.races,
+            'users': self.users,
+            'scores': self.scores.tolist(),
+            'points': self.points.tolist(),
+            'places': self.places.tolist(),
+            'cumulative': self.cumulative.tolist(),
+            'totals': self.totals.tolist(),
+            'p1': self.p1.tolist(),
+            'podiums': self.podiums.tolist(),
+        })
+
+    @classmethod
+    def from_json(cls, body):
+        state = json.loads(body)
+        standings = cls()
+        standings.races = state['races']
+        standings.users = state['users']
+        standings._user_index = {user: i for i, user in enumerate(standings.users)}
+        shape = (len(standings.users), len(standings.races))
+        for name in ['scores', 'points', 'places', 'cumulative']:
+            setattr(standings, name, np.array(state[name], dtype='int64').reshape(shape))
+        for name in ['totals', 'p1', 'podiums']:
+            setattr(standings, name, np.array(state[name], dtype='int64'))
+        return standings
+
+    @classmethod
+    def from_season_scores(cls, all_scores, all_f1_points, all_places):
+        """Builds the standings from scratch from the get_season_scores matrices."""
+        standings = cls()
+        for race in all_scores.columns:
+            standings.apply_race(race, pd.DataFrame({'Predictor': all_scores.index,
+                                                     'Score': all_scores[race].to_numpy(),
+                                                     'Points': all_f1_points[race].to_numpy(),
+                                                     'Place': all_places[race].to_numpy()}))
+        return standings
+
+    def differences(self, other):
+        """Lists the ways other disagrees with these standings (empty if they match)."""
+        differences = []
+        if self.races != other.races:
+            differences.append(f"races: {self.races} != {other.races}")
+        if sorted(self.users) != sorted(other.users):
+            differences.append(f"users: {sorted(self.users)} != {sorted(other.users)}")
+        if differences:
+            return differences
+        # Compare user by user, the two may list users in a different order
+        order = [other._user_index[user] for user in self.users]
+        for name in ['scores', 'points', 'places', 'cumulative', 'totals', 'p1', 'podiums']:
+            if not np.array_equal(getattr(self, name), getattr(other, name)[order]):
+                differences.append(f"{name} differ")
+        return differences
@@ -0,0 +1,400 @@
+import hashlib
+import json
+import threading
+import uuid
+from datetime import datetime, timezone
+from io import BytesIO
+from urllib.parse import quote, unquote
+import pandas as pd
+import metrics
+
+# botocore is imported inside the functions that catch its errors, so that
+# importing this module (and utils) doesn't pay for loading it
+
+def _not_modified(error):
+    """True if a ClientError is S3's answer to a conditional GET on an unchanged object."""
+    return (error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 304
+            or error.response.get('Error', {}).get('Code') in ('304', 'NotModified'))
+
+class WriteConflict(Exception):
+    """Raised by a conditional write when the object changed since it was read."""
+
+def _precondition_failed(error):
+    """True if a ClientError is S3 refusing a conditional write because the object changed."""
+    return (error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') in (409, 412)
+            or error.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict'))
+
+def put_if_unchanged(s3_client, bucket, key, body, etag, **kwargs):
+    """
+    Writes key only if it still has etag, or for etag None only if it does not
+    exist yet, raising WriteConflict otherwise. Returns the put_object response.
+    """
+    from botocore.exceptions import ClientError
+    condition = {'IfMatch': etag} if etag is not None else {'IfNoneMatch': '*'}
+    try:
+        return s3_client.put_object(Bucket=bucket, Key=key, Body=body, **condition, **kwargs)
+    except ClientError as e:
+        if _precondition_failed(e):
+            raise WriteConflict(f"s3://{bucket}/{key} changed since it was read") from e
+        raise
+
+class CachedS3Object:
+    """
+    Keeps a parsed in-process copy of one S3 object.
+    Every get() revalidates with a conditional GET (IfNoneMatch on the ETag we
+    hold), so the object is only downloaded and parsed again when it changed.
+    parse: callable(body stream) -> value, e.g. pd.read_csv
+    The cached value is shared by every caller and must be treated as read-only.
+    """
+
+    def __init__(self, s3_client, bucket, key, parse):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.parse = parse
+        self.etag = None
+        self.value = None
+        self.downloads = 0
+        self.revalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the current parsed object, raising on S3 errors."""
+        return self.get_versioned()[0]
+
+    def get_versioned(self):
+        """Returns (current parsed object, its ETag), e.g. for a later put_if_unchanged."""
+        from botocore.exceptions import ClientError
+        with self._lock:
+            kwargs = {'Bucket': self.bucket, 'Key': self.key}
+            if self.etag is not None:
+                kwargs['IfNoneMatch'] = self.etag
+            try:
+                response = self.s3_client.get_object(**kwargs)
+            except ClientError as e:
+                if self.etag is not None and _not_modified(e):
+                    self.revalidations += 1
+                    return self.value, self.etag
+                raise
+            self.value = self.parse(response['Body'])
+            self.etag = response.get('ETag')
+            self.downloads += 1
+            return self.value, self.etag
+
+    def set(self, value, etag):
+        """Replaces the cached copy after we wrote value ourselves (etag from put_object)."""
+        with self._lock:
+            self.value = value
+            self.etag = etag
+
+    def put_if_unchanged(self, value, body, etag, **kwargs):
+        """
+        Writes body (value serialized) only if the object still has etag (None: does
+        not exist yet), raising WriteConflict otherwise, and keeps value as our copy.
+        """
+        response = put_if_unchanged(self.s3_client, self.bucket, self.key, body, etag, **kwargs)
+        self.set(value, response.get('ETag'))
+
+    def invalidate(self):
+        """Forgets the cached copy so the next get() downloads the object again."""
+        with self._lock:
+            self.value = None
+            self.etag = None
+
+@metrics.timed('parse.parquet')
+def read_parquet(body):
+    """Parses a Parquet object body, decoding categorical columns back to plain values."""
+    df = pd.read_parquet(BytesIO(body.read()))
+    categorical = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    return df.astype({col: object for col in categorical})
+
+@metrics.timed('serialize.parquet')
+def to_parquet(df):
+    """Serializes df to compressed Parquet bytes, storing text columns as categoricals."""
+    text = [col for col in df.columns if not pd.api.types.is_numeric_dtype(df[col])
+            and not pd.api.types.is_datetime64_any_dtype(df[col])]
+    buffer = BytesIO()
+    df.astype({col: 'category' for col in text}).to_parquet(buffer, index=False, compression='zstd')
+    return buffer.getvalue()
+
+class PartitionedPredictionsStore:
+    """
+    Predictions stored as one Parquet object per race under prefix, e.g.
+    predictions/Australian%20Grand%20Prix.parquet. Reads only fetch the races
+    they ask for, and saving a race rewrites that race's object only. Each
+    partition is cached in process and revalidated by ETag like CachedS3Object.
+    """
+
+    suffix = '.parquet'
+
+    def __init__(self, s3_client, bucket, prefix, columns=()):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        # Columns of the (empty) frame returned when no requested race has predictions
+        self.columns = list(columns)
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    def partition_key(self, race):
+        return f"{self.prefix}{quote(race, safe='')}{self.suffix}"
+
+    def _partition(self, race):
+        with self._lock:
+            if race not in self._partitions:
+                self._partitions[race] = CachedS3Object(self.s3_client, self.bucket,
+                                                        self.partition_key(race), read_parquet)
+            return self._partitions[race]
+
+    def races(self):
+        """Returns the races that have a partition, in key order."""
+        races = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                name = item['Key'][len(self.prefix):]
+                if name.endswith(self.suffix):
+                    races.append(unquote(name[:-len(self.suffix)]))
+        return races
+
+    def read(self, races=None):
+        """Returns the predictions for races (all races if None) as one DataFrame."""
+        return self.read_versioned(races)[0]
+
+    def read_versioned(self, races=None):
+        """
+        Like read(), also returning {race: ETag of its partition, None if it has none
+        yet}, e.g. to save() the races back only if nobody else changed them.
+        """
+        from botocore.exceptions import ClientError
+        if races is None:
+            races = self.races()
+        frames = []
+        versions = {}
+        for race in races:
+            try:
+                race_df, versions[race] = self._partition(race).get_versioned()
+                frames.append(race_df)
+            except ClientError as e:
+                # No one has predicted this race yet
+                if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+                    raise
+                versions[race] = None
+        if not frames:
+            return pd.DataFrame(columns=self.columns), versions
+        return pd.concat(frames, ignore_index=True), versions
+
+    def write_race(self, race, race_df, versions=None):
+        """
+        Replaces the partition for one race with race_df.
+        versions: from read_versioned, to only write if the partition did not change
+        since (raising WriteConflict otherwise)
+        """
+        race_df = race_df.reset_index(drop=True)
+        if versions is not None:
+            self._partition(race).put_if_unchanged(race_df, to_parquet(race_df), versions.get(race))
+            return
+        response = self.s3_client.put_object(Bucket=self.bucket, Key=self.partition_key(race),
+                                             Body=to_parquet(race_df))
+        self._partition(race).set(race_df, response.get('ETag'))
+
+    def save(self, predictions_df, versions=None):
+        """Writes every race present in predictions_df, leaving other races untouched."""
+        for race, race_df in predictions_df.groupby('Race', sort=False):
+            self.write_race(race, race_df, versions)
+
+    def export_csv(self, key):
+        """Writes all races as a single CSV object, for looking at by hand."""
+        self.s3_client.put_object(Bucket=self.bucket, Key=key,
+                                  Body=self.read().to_csv(index=False))
+
+def migrate_csv_to_partitions(s3_client, bucket, csv_key, store):
+    """
+    One-shot migration of the single predictions CSV into per-race partitions.
+    Returns {race: number of rows written}. The CSV itself is left in place.
+    """
+    predictions_df = pd.read_csv(s3_client.get_object(Bucket=bucket, Key=csv_key)['Body'])
+    store.save(predictions_df)
+    return predictions_df.groupby('Race', sort=False).size().to_dict()
+
+class SubmissionLog:
+    """
+    Append-only log of prediction submissions, one immutable S3 object per
+    submission: {prefix}{race}/{name}/{submitted_at}-{id}.json, or per batch of
+    submissions for one race: {prefix}{race}/batch-{submitted_at}-{id}.json
+    Concurrent submitters never write the same key, so no submission can
+    overwrite another. Readers take the latest submission per (name, race);
+    compaction folds them into the read-optimized store and deletes them.
+    Objects never change once written, so parsed records are cached by key.
+    """
+
+    def __init__(self, s3_client, bucket, prefix):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def race_prefix(self, race):
+        return f"{self.prefix}{quote(race, safe='')}/"
+
+    def submit(self, record):
+        """Writes one submission record (a dict with at least Name and Race), returning its key."""
+        submitted_at = datetime.now(timezone.utc)
+        record = {**record, 'Submitted': submitted_at.isoformat()}
+        key = (f"{self.race_prefix(record['Race'])}{quote(record['Name'], safe='')}/"
+               f"{submitted_at.strftime('%Y%m%dT%H%M%S%fZ')}-{uuid.uuid4().hex}.json")
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=json.dumps(record),
+                                  ContentType='application/json')
+        with self._lock:
+            self._records[key] = [record]
+        return key
+
+    def submit_batch(self, race, records):
+        """
+        Writes several submission records for one race as a single object, returning its key.
+        Each record keeps its own Submitted timestamp (set when it was accepted), so
+        the time of the write does not change which submission is the latest.
+        """
+        key = (f"{self.race_prefix(race)}batch-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')}-"
+               f"{uuid.uuid4().hex}.json")
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=json.dumps({'records': records}),
+                                  ContentType='application/json')
+        with self._lock:
+            self._records[key] = list(records)
+        return key
+
+    def keys(self, races=None):
+        """Lists the keys of all pending submissions, for some races or all of them."""
+        prefixes = [self.prefix] if races is None else [self.race_prefix(race) for race in races]
+        keys = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for prefix in prefixes:
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+                keys.extend(item['Key'] for item in page.get('Contents', []) if item['Key'].endswith('.json'))
+        return keys
+
+    def _records_at(self, key):
+        """
+        Returns the records in one submission object (one, or several for a batch),
+        or None if it was compacted (and deleted) since it was listed.
+        """
+        from botocore.exceptions import ClientError
+        with self._lock:
+            if key in self._records:
+                return self._records[key]
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            raise
+        body = json.loads(response['Body'].read())
+        records = body['records'] if 'records' in body else [body]
+        with self._lock:
+            self._records[key] = records
+        return records
+
+    def latest(self, races=None, keys=None):
+        """
+        Returns (records_df, keys): the latest pending submission per (Name, Race)
+        and the keys of every submission it was built from.
+        """
+        if keys is None:
+            keys = self.keys(races)
+        records_at = {key: self._records_at(key) for key in keys}
+        # Submissions compacted in the meantime are in the predictions store already
+        keys = [key for key in keys if records_at[key] is not None]
+        records = [record for key in keys for record in records_at[key]]
+        if not records:
+            return pd.DataFrame(), keys
+        records_df = (pd.DataFrame(records).sort_values('Submitted', kind='stable')
+                      .drop_duplicates(subset=['Name', 'Race'], keep='last')
+                      .reset_index(drop=True))
+        return records_df, keys
+
+    def delete(self, keys):
+        """Removes submissions that have been compacted into the main store."""
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            self.s3_client.delete_objects(Bucket=self.bucket,
+                                          Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+        with self._lock:
+            for key in keys:
+                self._records.pop(key, None)
+
+def apply_submissions(predictions_df, submissions_df, columns):
+    """
+    Overlays the latest submissions on predictions_df: a submission replaces any
+    existing rows for the same (Name, Race) and new ones are appended.
+    columns: the prediction columns to keep from the submissions
+    """
+    if submissions_df.empty:
+        return predictions_df
+    submissions_df = submissions_df[columns]
+    if predictions_df.empty:
+        return submissions_df.reset_index(drop=True)
+    submitted = pd.MultiIndex.from_frame(submissions_df[['Name', 'Race']])
+    replaced = pd.MultiIndex.from_frame(predictions_df[['Name', 'Race']]).isin(submitted)
+    return pd.concat([predictions_df[~replaced], submissions_df], ignore_index=True)
+
+class SnapshotStore:
+    """
+    Materialized per-race tables, one Parquet object per race under prefix.
+    Each snapshot records a fingerprint of the inputs it was built from and
+    get() only returns it while the caller's fingerprint still matches, so a
+    changed prediction or result invalidates it without any bookkeeping.
+    Valid snapshots are also kept in process, so repeat reads cost nothing.
+    """
+
+    def __init__(self, s3_client, bucket, prefix):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def key(self, race):
+        return f"{self.prefix}{quote(race, safe='')}.parquet"
+
+    def get(self, race, fingerprint):
+        """Returns the snapshot for race if it was built from fingerprint, else None."""
+        from botocore.exceptions import ClientError
+        with self._lock:
+            cached = self._snapshots.get(race)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key(race))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            raise
+        if response.get('Metadata', {}).get('fingerprint') != fingerprint:
+            return None
+        table = read_parquet(response['Body'])
+        with self._lock:
+            self._snapshots[race] = (fingerprint, table)
+        return table
+
+    def put(self, race, table, fingerprint):
+        self.s3_client.put_object(Bucket=self.bucket, Key=self.key(race), Body=to_parquet(table),
+                                  Metadata={'fingerprint': fingerprint})
+        with self._lock:
+            self._snapshots[race] = (fingerprint, table)
+
+    def delete(self, race):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self.key(race))
+        with self._lock:
+            self._snapshots.pop(race, None)
+
+def fingerprint(*parts):
+    """Stable hash of DataFrames and JSON-serializable values, used to key snapshots."""
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            digest.update(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes())
+            digest.update(','.join(map(str, part.columns)).encode())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
@@ -1,8 +1,7 @@
 import streamlit as st
-import boto3
-import os
-import pandas as pd
 from dotenv import load_dotenv
+import leagues
+import metrics
 
 # Define pages and their navigation logic
 PAGES = {
@@ -15,50 +14,44 @@ PAGES = {
 
 load_dotenv()
 
-# Retrieve AWS credentials from environment variables
-aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-# aws_region = os.getenv('AWS_DEFAULT_REGION')
-
-# Initialize an S3 client
-s3_client = boto3.client('s3')
-
 # Function to handle authentication
 def authenticate():
     if "authenticated" not in st.session_state:
         st.session_state["authenticated"] = False
 
-def get_participants_from_s3():
-    try:
-        # Get the file from S3
-        response = s3_client.get_object(Bucket=os.getenv('S3_BUCKET_NAME'), 
-                                        Key=os.getenv('PARTICIPANTS_FILE'))
-        # Read the content into a pandas DataFrame
-        participants_df = pd.read_csv(response['Body'])
-        return participants_df
-    except Exception as e:
-        st.error(f"Error reading file from S3: {e}")
-        return pd.DataFrame()
-
 # Function to show the login page
 def login():
     st.title("Login")
-    st.markdown("Please log in to access the 2025 F1 WPC.")
-    participants_df = get_participants_from_s3().dropna()
-    username = st.selectbox("Username",options=participants_df.Username.unique(),
+    st.markdown(f"Please log in to access the {leagues.default_league().season} F1 WPC.")
+    # Imported here so the page shows up before pandas and the S3 client have loaded
+    import utils
+    hosted_leagues = utils.list_leagues()
+    league = hosted_leagues[0]
+    if len(hosted_leagues) > 1:
+        league = st.selectbox("League", options=hosted_leagues, format_func=leagues.label)
+    try:
+        participants = utils.get_participants(league)
+    except Exception as e:
+        st.error(f"Error reading file from S3: {e}")
+        return
+    username = st.selectbox("Username",options=list(participants),
                             index=None,help="You chose these, not me")
     password = st.text_input("Password", type="password",
                              help="Put that pigeon brain to good use. It's case sensitive.")
 
     if st.button("Log in"):
-        if password == participants_df.loc[participants_df.Username==username,'Password'].values[0]:
+        participant = utils.authenticate(username, password, league)
+        if participant is not None:
             st.session_state["authenticated"] = True
-            st.session_state["user"] = participants_df.loc[participants_df.Username==username,'Name'].values[0]
+            st.session_state["user"] = participant.name
+            st.session_state["league"] = league
             st.success("Login successful! Redirecting...")
             st.session_state["page"] = "Main"  # Set page to Main after login
             st.rerun()  # Re-run the app to go to the Main page
+        elif username in participants:
+            st.error(f"Incorrect password! Hint: {participants[username].hint}")
         else:
-            st.error(f"Incorrect password! Hint: {participants_df.loc[participants_df.Username==username,'Hint'].values[0]}")
+            st.error("Pick your username first!")
             
 
 # Function to show the main page after login
@@ -70,7 +63,7 @@ def main_page():
     
     st.title("Home Page")
     
-    st.markdown(f"""Hi, **{st.session_state.user}**! Welcome to the home page for the F1 WPC 2025! Here you can view, edit, or make new predictions,
+    st.markdown(f"""Hi, **{st.session_state.user}**! Welcome to the home page for the F1 WPC {st.session_state.get('league', leagues.default_league()).season}! Here you can view, edit, or make new predictions,
                 view the results of past races, or check the current season standings.""")
 
     # Navigation buttons
@@ -103,4 +96,5 @@ def app():
         main_page()
 
 if __name__ == "__main__":
-    app()
+    with metrics.render('Home'):
+        app()
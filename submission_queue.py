@@ -0,0 +1,220 @@
+"""
+Asynchronous prediction submissions.
+
+Submitting validates the picks, stamps the record with the server's clock and
+queues it. A background thread writes the queue to the submission log in
+batches (one S3 object per race per batch), and submit() returns a Receipt
+only once the batch holding the record is written, so a receipt always means
+the submission is in S3.
+
+The Submitted timestamp taken when a record is accepted is the one that counts:
+it decides whether the record beat the race start and which of a user's
+submissions is the latest, however long the write takes afterwards.
+"""
+import atexit
+import queue
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent import futures
+from datetime import datetime, timezone
+import metrics
+
+Receipt = namedtuple('Receipt', ['id', 'name', 'race', 'submitted_at'])
+
+class SubmissionRejected(ValueError):
+    """A submission that fails validation, the message is meant for the user."""
+
+class SubmissionNotStored(RuntimeError):
+    """Raised by submit() when the record was not written in time, it was not acknowledged."""
+
+def validate_submission(record, columns, race_start, submitted_at):
+    """
+    Raises SubmissionRejected unless record has a name, a race and a different
+    driver in every column of columns, and submitted_at is before race_start.
+    """
+    if not record.get('Name'):
+        raise SubmissionRejected("Submissions need a name.")
+    if race_start is None:
+        raise SubmissionRejected(f"{record.get('Race')} is not on the schedule.")
+    if submitted_at >= race_start:
+        raise SubmissionRejected("The race has already started. You can no longer submit or edit predictions.")
+    picks = [record.get(column) for column in columns]
+    if not all(picks):
+        raise SubmissionRejected("Pick a driver for every position.")
+    if len(set(picks)) != len(picks):
+        raise SubmissionRejected("Each driver can only be picked once.")
+
+class SubmissionQueue:
+    """
+    In-process queue in front of a storage.SubmissionLog.
+    The worker thread takes up to batch_size records (waiting up to
+    flush_interval seconds for more after the first one) and writes them with
+    SubmissionLog.submit_batch, one object per race. Each submitter waits for
+    the write of its own record: if it fails, or does not finish within
+    write_timeout seconds, submit() raises and the record is not acknowledged.
+    on_stored: optional callable(races) run after records for races were
+    written, before their submitters are acknowledged
+    """
+
+    def __init__(self, submission_log, batch_size=100, flush_interval=0.25, on_stored=None, write_timeout=30):
+        self.submission_log = submission_log
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_stored = on_stored
+        self.write_timeout = write_timeout
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._worker = None
+
+    def submit(self, record, submitted_at=None):
+        """
+        Queues a (validated) record and waits until it is written, returning its
+        Receipt. Raises the write's error, or SubmissionNotStored on timeout.
+        """
+        submitted_at = submitted_at or datetime.now(timezone.utc)
+        receipt = Receipt(uuid.uuid4().hex, record['Name'], record['Race'], submitted_at)
+        record = {**record, 'Submitted': submitted_at.isoformat(), 'Id': receipt.id}
+        stored = futures.Future()
+        with self._lock:
+            self._pending.add(stored)
+            self._start_worker()
+        stored.add_done_callback(self._done)
+        self._queue.put((record, stored))
+        metrics.incr('submissions.queued')
+        try:
+            stored.result(timeout=self.write_timeout)
+        except futures.TimeoutError:
+            # Not written yet: take it back, unless the write already started
+            if stored.cancel():
+                raise SubmissionNotStored(f"Submission {receipt.id} was not saved in time") from None
+            try:
+                stored.result(timeout=self.write_timeout)
+            except futures.TimeoutError:
+                raise SubmissionNotStored(f"Submission {receipt.id} was not saved in time") from None
+        return receipt
+
+    def _done(self, stored):
+        with self._idle:
+            self._pending.discard(stored)
+            self._idle.notify_all()
+
+    def flush(self, timeout=None):
+        """Waits until everything queued so far is written or failed. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _start_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='submission-queue', daemon=True)
+            self._worker.start()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        # Submitters that gave up waiting have cancelled their records
+        return [(record, stored) for record, stored in batch if stored.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                # Nothing is acknowledged unless it was written
+                for _, stored in batch:
+                    if not stored.done():
+                        stored.set_exception(e)
+
+    def write_batch(self, batch):
+        """
+        Writes batch, a list of (record, Future), race by race and resolves each
+        record's Future. Returns the records that could not be written.
+        """
+        by_race = {}
+        for record, stored in batch:
+            by_race.setdefault(record['Race'], []).append((record, stored))
+        failed = []
+        for race, entries in by_race.items():
+            records = [record for record, _ in entries]
+            try:
+                with metrics.span('io.submission_batch'):
+                    self.submission_log.submit_batch(race, records)
+            except Exception as e:
+                metrics.incr('submissions.write_errors')
+                for _, stored in entries:
+                    stored.set_exception(e)
+                failed.extend(records)
+                continue
+            metrics.incr('submissions.stored', len(records))
+            if self.on_stored is not None:
+                self.on_stored([race])
+            for _, stored in entries:
+                stored.set_result(None)
+        return failed
+
+class Compactor:
+    """
+    Folds the submission log into the predictions store in the background.
+    add(races) marks races as having new submissions; a thread of its own runs
+    compact(races) for them at most every interval seconds, so a burst of
+    submissions costs one compaction and submitters never wait for it. Races
+    whose compaction failed are tried again on the next run.
+    """
+
+    def __init__(self, compact, interval=60):
+        self.compact = compact
+        self.interval = interval
+        self._races = set()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def add(self, races):
+        with self._lock:
+            self._races.update(races)
+            if self._races and (self._worker is None or not self._worker.is_alive()):
+                self._worker = threading.Thread(target=self._run, name='submission-compactor', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                races, self._races = self._races, set()
+                if not races:
+                    # Nothing new since the last run, the next add() starts a new thread
+                    self._worker = None
+                    return
+            try:
+                with metrics.span('io.auto_compact'):
+                    self.compact(sorted(races))
+            except Exception:
+                metrics.incr('submissions.compact_errors')
+                with self._lock:
+                    self._races.update(races)
+
+# Queues that still hold records when the process exits get a few seconds to write them
+_queues = []
+
+def register(submission_queue):
+    _queues.append(submission_queue)
+    return submission_queue
+
+@atexit.register
+def _flush_all():
+    for submission_queue in _queues:
+        submission_queue.flush(timeout=5)
@@ -0,0 +1,28 @@
+import os
+import sys
+import pytest
+
+# The app's modules live at the top of the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BUCKET = 'wpc-test'
+
+@pytest.fixture
+def s3(monkeypatch):
+    """A mocked S3 bucket (moto) wired up as the app's bucket, with empty app caches."""
+    moto = pytest.importorskip('moto')
+    import streamlit as st
+    for name, value in {'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing',
+                        'AWS_DEFAULT_REGION': 'us-east-1', 'S3_BUCKET_NAME': BUCKET,
+                        'PREDICTIONS_FILE': 'predictions.csv', 'PARTICIPANTS_FILE': 'participants.csv'}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv('PREDICTIONS_PREFIX', raising=False)
+    with moto.mock_aws():
+        import boto3
+        s3_client = boto3.client('s3')
+        s3_client.create_bucket(Bucket=BUCKET)
+        st.cache_resource.clear()
+        st.cache_data.clear()
+        yield s3_client
+        st.cache_resource.clear()
+        st.cache_data.clear()
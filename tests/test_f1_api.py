@@ -0,0 +1,12 @@
+import pytest
+import f1_api
+
+@pytest.mark.parametrize('url, endpoint', [
+    ('https://api.jolpi.ca/ergast/f1/2025/races/', 'races'),
+    ('https://api.jolpi.ca/ergast/f1/2025/3/drivers/?format=json', 'drivers'),
+    ('https://api.jolpi.ca/ergast/f1/2025/3/results/?format=json', 'results'),
+    ('https://api.jolpi.ca/ergast/f1/2025/3/laps/1/?format=json', 'laps'),
+    ('https://api.jolpi.ca/ergast/f1/2025/3/laps/57/?format=json', 'laps'),
+])
+def test_endpoint(url, endpoint):
+    assert f1_api._endpoint(url) == endpoint
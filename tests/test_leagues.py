@@ -0,0 +1,23 @@
+import leagues
+
+def test_settings_are_read_when_used(monkeypatch):
+    # .env is loaded after leagues is imported, so nothing may be read on import
+    monkeypatch.setenv('F1_SEASON', '2031')
+    monkeypatch.setenv('F1_LEAGUE', 'office')
+    monkeypatch.setenv('LEAGUES_PREFIX', 'hosted/')
+    monkeypatch.delenv('LEAGUES_INDEX', raising=False)
+    assert leagues.default_league() == leagues.League('2031', 'office')
+    assert leagues.index_key() == 'hosted/index.json'
+    assert leagues.storage_keys(leagues.League('2031', 'other'))['standings_file'] == 'hosted/2031/other/standings.json'
+
+def test_login_reruns_do_not_check_the_index_each_time(s3):
+    import utils
+    calls = []
+    s3.put_object(Bucket='wpc-test', Key=leagues.index_key(), Body=leagues.index_body([leagues.League('2025', 'office')]))
+    utils.get_s3_client().meta.events.register('before-call.s3.GetObject', lambda **kwargs: calls.append(1))
+    for _ in range(3):
+        assert leagues.League('2025', 'office') in utils.list_leagues()
+    assert len(calls) == 1
+
+    utils.register_league(leagues.League('2026', 'office'))
+    assert leagues.League('2026', 'office') in utils.list_leagues()
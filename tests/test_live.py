@@ -0,0 +1,27 @@
+import live
+
+def test_api_feed_finishes_once_official_results_are_out(monkeypatch):
+    laps = {1: ['max', 'lando'], 2: ['lando', 'max']}
+    results = []
+
+    def get_json(url, ttl, is_final=None):
+        if url == 'drivers':
+            return {'MRData': {'DriverTable': {'Drivers': [
+                {'driverId': 'max', 'givenName': 'Max', 'familyName': 'Verstappen'},
+                {'driverId': 'lando', 'givenName': 'Lando', 'familyName': 'Norris'}]}}}
+        if url == 'results':
+            return {'MRData': {'RaceTable': {'Races': [{'Results': results}]}}}
+        order = laps.get(int(url.split('/')[-1]))
+        races = [{'Laps': [{'Timings': [{'driverId': driver, 'position': str(position)}
+                                        for position, driver in enumerate(order, start=1)]}]}] if order else []
+        return {'MRData': {'RaceTable': {'Races': races}}}
+
+    monkeypatch.setattr(live.f1_api, 'get_json', get_json)
+    feed = live.ApiPositionFeed('laps/{lap}', 'drivers', 'results')
+    assert feed.poll() == (2, {1: 'Lando Norris', 2: 'Max Verstappen'})
+    # Between the last lap and the official results
+    assert feed.poll() is None
+    assert not feed.finished
+    results.append({'position': '1'})
+    assert feed.poll() is None
+    assert feed.finished
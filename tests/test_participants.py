@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+import pytest
+import participants
+
+def test_verify_password():
+    password_hash = participants.hash_password('secret')
+    assert participants.verify_password('secret', password_hash)
+    assert not participants.verify_password('wrong', password_hash)
+
+@pytest.mark.parametrize('password_hash', ['', 'not a hash', f'{participants.HASH_ALGORITHM}$many$salt$digest',
+                                           f'{participants.HASH_ALGORITHM}$0$salt$digest', 'md5$1000$salt$digest'])
+def test_malformed_hash_is_rejected(password_hash):
+    assert not participants.verify_password('secret', password_hash)
+
+class Participants:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get(self):
+        return self.directory
+
+def test_unknown_username_checks_the_dummy_hash_on_first_use():
+    participants._dummy_hash.cache_clear()
+    password_hash = participants.hash_password('secret')
+    directory = participants.ParticipantDirectory(
+        Participants({'User 1': participants.Participant('User 1', 'User 1', '', password_hash)}))
+    assert directory.authenticate('User 1', 'secret').username == 'User 1'
+    assert participants._dummy_hash.cache_info().currsize == 0
+    assert directory.authenticate('Nobody', 'secret') is None
+    assert participants._dummy_hash.cache_info().currsize == 1
+
+def test_import_does_not_hash():
+    script = ("import hashlib\ncalls = []\npbkdf2_hmac = hashlib.pbkdf2_hmac\n"
+              "hashlib.pbkdf2_hmac = lambda *args, **kwargs: calls.append(1) or pbkdf2_hmac(*args, **kwargs)\n"
+              "import participants\nassert not calls, 'hashed at import'\n")
+    subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   check=True)
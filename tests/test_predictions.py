@@ -0,0 +1,39 @@
+import threading
+import pandas as pd
+import utils
+from test_submissions import COLUMNS, RACES, record
+
+def test_invalidate_drops_every_selection_holding_the_race(s3):
+    s3.put_object(Bucket='wpc-test', Key='predictions.csv', Body=pd.DataFrame(columns=COLUMNS).to_csv(index=False))
+    log = utils.league_data().submission_log
+    log.submit(record('User 1', RACES[0], 0))
+    log.submit(record('User 1', RACES[1], 0))
+    selections = [None, [RACES[0]], RACES[:2], [RACES[1], RACES[0]]]
+    for races in selections:
+        assert utils.get_prediction_codes(races).user_picks('User 1', RACES[0])[0] == record('User 1', RACES[0], 0)['P1']
+
+    log.submit(record('User 1', RACES[0], 1))
+    utils.invalidate_predictions(RACES[0])
+    for races in selections:
+        assert utils.get_prediction_codes(races).user_picks('User 1', RACES[0])[0] == record('User 1', RACES[0], 1)['P1']
+
+def test_season_results_are_fetched_without_streamlit_caches_in_threads(monkeypatch):
+    utils.fetch_season_results.clear()
+    calls = []
+
+    def get_json(url, ttl, is_final=None):
+        calls.append(threading.current_thread().name)
+        round = int(url.split('/')[-3])
+        return {'MRData': {'RaceTable': {'Races': [{'Results': [
+            {'position': '1', 'Driver': {'givenName': 'Driver', 'familyName': str(round)}}]}]}}}
+
+    def cached_fetch(round, season):
+        raise AssertionError('fetch_race_results called from a worker thread')
+
+    monkeypatch.setattr(utils.f1_api, 'get_json', get_json)
+    monkeypatch.setattr(utils, 'fetch_race_results', cached_fetch)
+    assert utils.get_season_results(range(1, 6), '2099') == {round: {1: f'Driver {round}'} for round in range(1, 6)}
+    assert len(calls) == 5
+    # The whole season is one cache entry
+    assert utils.get_season_results(range(1, 6), '2099') == {round: {1: f'Driver {round}'} for round in range(1, 6)}
+    assert len(calls) == 5
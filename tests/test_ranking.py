@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import ranking
+import utils
+
+def test_min_rank_places():
+    order, places = ranking.rank_descending([10, 30, 20, 30, 10, 5])
+    assert list(order) == [1, 3, 2, 0, 4, 5]
+    assert list(places) == [1, 1, 3, 4, 4, 6]
+
+def test_empty():
+    order, places = ranking.rank_descending([])
+    assert len(order) == 0 and len(places) == 0
+    assert ranking.rank_rows_descending(np.zeros((3, 0), dtype='int64')).shape == (3, 0)
+
+def test_later_keys_break_ties():
+    # Points, then P1 finishes, then podiums
+    keys = np.array([[50, 1, 2],
+                     [50, 2, 2],
+                     [50, 1, 3],
+                     [60, 0, 0],
+                     [50, 1, 2]])
+    order, places = ranking.rank_descending(keys)
+    assert list(order) == [3, 1, 2, 0, 4]
+    assert list(places) == [1, 2, 3, 4, 4]
+
+def test_places_to_points():
+    points = ranking.places_to_points([1, 1, 3, 10, 11, 0, 40], utils.f1_scoring_dict)
+    assert list(points) == [25, 25, 15, 1, 0, 0, 0]
+
+@pytest.mark.parametrize('seed', range(10))
+def test_rank_rows_matches_rank_descending(seed):
+    rng = np.random.default_rng(seed)
+    # Few distinct scores, so most rows have ties
+    scores = rng.integers(0, 6, size=(4, 7, int(rng.integers(1, 12))))
+    places = ranking.rank_rows_descending(scores)
+    assert places.shape == scores.shape
+    for index in np.ndindex(scores.shape[:-1]):
+        order, expected = ranking.rank_descending(scores[index])
+        assert list(places[index][order]) == list(expected)
@@ -0,0 +1,33 @@
+import json
+import os
+import pandas as pd
+import pytest
+import score
+import utils
+
+def write_dump(tmp_path, season):
+    schedule_payload = {'MRData': {'RaceTable': {'Races': [
+        {'round': '1', 'raceName': 'Bahrain Grand Prix', 'date': f'{season}-03-02', 'time': '15:00:00Z'}]}}}
+    results = {'1': {'MRData': {'RaceTable': {'Races': [{'Results': [
+        {'position': '1', 'Driver': {'givenName': 'Driver', 'familyName': '1'}}]}]}}}}
+    path = tmp_path / 'dump.json'
+    path.write_text(json.dumps({'season': season, 'schedule': schedule_payload, 'results': results}))
+    predictions = tmp_path / 'predictions.csv'
+    pd.DataFrame([{'Name': 'User 1', 'Race': 'Bahrain Grand Prix', 'P1': 'Driver 1',
+                   **{column: None for column in utils.PREDICTION_COLUMNS[1:]}}]).to_csv(predictions, index=False)
+    return str(path), str(predictions)
+
+def test_results_dump_is_scored_as_its_own_season(tmp_path):
+    dump, predictions = write_dump(tmp_path, '2000')
+    output = tmp_path / 'out'
+    assert score.main(['--results', dump, '--predictions', predictions, '--output', str(output)]) == 0
+    assert os.path.exists(output / '2000' / 'main' / 'standings.csv')
+    assert not os.path.exists(output / '2025')
+
+def test_results_dump_of_another_season_is_rejected(tmp_path):
+    dump, predictions = write_dump(tmp_path, '2000')
+    with pytest.raises(SystemExit):
+        score.main(['--league', '2025/main', '--results', dump, '--predictions', predictions,
+                    '--output', str(tmp_path / 'out')])
+    with pytest.raises(ValueError):
+        score.read_results_dump(dump, '2025')
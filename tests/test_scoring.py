@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+import utils
+
+DRIVERS = [f'Driver {i}' for i in range(22)]
+
+# The original one-user-at-a-time scoring, kept here as the reference
+def reference_calculate_scores(user_predictions, race_results):
+    user_scores = []
+    predicted_pos = 1
+    for drop_col in ['Race', 'Name']:
+        if drop_col in user_predictions.columns:
+            user_predictions = user_predictions.drop(columns=drop_col)
+    for position in user_predictions.columns:
+        driver = user_predictions[position].values[0]
+        try:
+            real_pos = race_results[race_results['Driver'] == driver].index.tolist()[0]
+            user_scores.append(max(0, (10 - abs(real_pos - predicted_pos))))
+        except IndexError:
+            user_scores.append(0)
+        predicted_pos += 1
+    return sum(user_scores)
+
+def reference_user_scores(predictions_df, race_results):
+    """{predictor: (score, place, points)} with tied users sharing the higher place."""
+    scores = {name: reference_calculate_scores(predictions_df[predictions_df['Name'] == name], race_results)
+              for name in predictions_df['Name'].unique()}
+    places = {name: 1 + sum(other > score for other in scores.values()) for name, score in scores.items()}
+    return {name: (scores[name], place, utils.f1_scoring_dict.get(place, 0)) for name, place in places.items()}
+
+def random_race(rng, users):
+    # Only some drivers are classified, the others score 0 wherever they were picked
+    classified = rng.permutation(DRIVERS)[:rng.integers(5, len(DRIVERS))]
+    race_results = utils.race_results_frame({position: driver for position, driver in enumerate(classified, start=1)})
+    rows = []
+    for user in range(users):
+        picks = list(rng.permutation(DRIVERS)[:10])
+        # Some picks left empty
+        for k in rng.choice(10, size=rng.integers(0, 3), replace=False):
+            picks[k] = np.nan
+        rows.append({'Name': f'User {user}', 'Race': 'Race', **dict(zip(utils.PREDICTION_COLUMNS, picks))})
+    # Users with the same picks tie, and a second submission for a user is ignored
+    rows += [{**rows[0], 'Name': 'Copy of User 0'}, {**rows[1], 'Name': 'User 0'}]
+    return pd.DataFrame(rows), race_results
+
+@pytest.mark.parametrize('seed', range(20))
+def test_vectorized_scoring_matches_per_user_scoring(seed):
+    rng = np.random.default_rng(seed)
+    predictions_df, race_results = random_race(rng, users=int(rng.integers(2, 40)))
+    expected = reference_user_scores(predictions_df, race_results)
+
+    user_scores_df = utils.get_all_user_scores(predictions_df, race_results)
+    assert {row.Predictor: (row.Score, row.Place, row.Points) for row in user_scores_df.itertuples()} == expected
+    assert list(user_scores_df['Score']) == sorted(user_scores_df['Score'], reverse=True)
+
+    race_table = utils.score_race_table(predictions_df, race_results)
+    assert {row.Predictor: (row.Score, row.Place, row.Points) for row in race_table.itertuples()} == expected
+    points = race_table[[f'{col} Points' for col in utils.PREDICTION_COLUMNS]].sum(axis=1)
+    assert (points == race_table['Score']).all()
+
+def test_no_results_scores_zero():
+    predictions_df, _ = random_race(np.random.default_rng(0), users=3)
+    user_scores_df = utils.get_all_user_scores(predictions_df, utils.race_results_frame({}))
+    assert (user_scores_df['Score'] == 0).all()
+    assert (user_scores_df['Place'] == 1).all()
+    assert (user_scores_df['Points'] == 25).all()
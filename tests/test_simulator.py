@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import simulator
+import utils
+
+def make_season(remaining, points=(40, 30, 10, 0)):
+    rng = np.random.default_rng(0)
+    users = len(points)
+    return simulator.Season(users=[f'User {user}' for user in range(users)],
+                            points=np.array(points, dtype='int64'),
+                            p1=np.zeros(users, dtype='int64'),
+                            podiums=np.zeros(users, dtype='int64'),
+                            picks=np.array([rng.permutation(12)[:10] for _ in range(users)]),
+                            strengths=simulator.driver_strengths([{1: 0, 2: 1, 3: 2}], list(range(12))),
+                            remaining=remaining)
+
+def test_same_seed_same_table_for_any_workers(monkeypatch):
+    # Small batches, so the pool really splits the work
+    monkeypatch.setattr(simulator, 'BATCH_CELLS', 2000)
+    season = make_season(remaining=3)
+    in_process = simulator.simulate(season, utils.f1_scoring_dict, n_seasons=400, seed=7)
+    pooled = simulator.simulate(season, utils.f1_scoring_dict, n_seasons=400, seed=7, workers=2)
+    pd.testing.assert_frame_equal(in_process, pooled)
+    assert abs(in_process['Title chance'].sum() - 1) < 1e-3
+
+def test_points_to_clinch_is_nan_when_out_of_reach():
+    simulation_df = simulator.simulate(make_season(remaining=1), utils.f1_scoring_dict, n_seasons=10, seed=0)
+    # User 0 needs 16 of the last 25 points to stay ahead of User 1 winning it, User 2 can't clinch alone
+    assert simulation_df.loc['User 0', 'Points to clinch'] == 16
+    assert np.isnan(simulation_df.loc['User 2', 'Points to clinch'])
+    assert simulation_df.loc['User 3', 'Eliminated']
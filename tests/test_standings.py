@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta, timezone
+import schedule
+import standings
+import utils
+
+def test_standings_only_check_races_that_have_started(monkeypatch):
+    now = datetime.now(timezone.utc)
+    races = [schedule.Race(round, f'Race {round}', now + timedelta(days=7 * (round - 3)), None, False)
+             for round in range(1, 7)]
+    season_schedule = schedule.Schedule(races)
+    requested = []
+
+    def get_season_results(rounds, season=None):
+        rounds = list(rounds)
+        requested.extend(rounds)
+        return {round: {} for round in rounds}
+
+    monkeypatch.setattr(utils, 'get_schedule', lambda season=None: season_schedule)
+    monkeypatch.setattr(utils, 'load_standings', lambda league: standings.SeasonStandings())
+    monkeypatch.setattr(utils, 'get_season_results', get_season_results)
+    utils.get_season_standings(season_schedule.names(), season_schedule.race_dict(), utils.leagues.default_league())
+    assert requested == [1, 2, 3]
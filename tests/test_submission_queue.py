@@ -0,0 +1,80 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import storage
+import submission_queue
+from test_submissions import RACES, record
+
+class WorkerKilled(BaseException):
+    """Not an Exception, so it ends the worker thread like a crash would."""
+
+def stored_ids(log):
+    return {record['Id'] for key in log.keys() for record in log._records_at(key)}
+
+def submit_all(submissions, count):
+    """Submits count records from many threads. Returns (receipts, errors)."""
+    def submit(i):
+        try:
+            return submissions.submit(record(f'User {i}', RACES[i % len(RACES)], 0))
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(submit, range(count)))
+    return ([result for result in results if isinstance(result, submission_queue.Receipt)],
+            [result for result in results if not isinstance(result, submission_queue.Receipt)])
+
+@pytest.fixture
+def log(s3):
+    return storage.SubmissionLog(s3, 'wpc-test', 'submissions/')
+
+def test_every_acknowledged_submission_is_stored(log):
+    submissions = submission_queue.SubmissionQueue(log, batch_size=10, flush_interval=0.05)
+    receipts, errors = submit_all(submissions, 60)
+    assert not errors
+    assert len(receipts) == 60
+    # Written before submit() returned, not just queued
+    assert {receipt.id for receipt in receipts} <= stored_ids(log)
+
+def test_failed_writes_are_not_acknowledged(log):
+    submit_batch = log.submit_batch
+    calls = []
+    lock = threading.Lock()
+
+    def flaky_submit_batch(race, records):
+        with lock:
+            calls.append(race)
+            fail = len(calls) % 3 == 0
+        if fail:
+            raise OSError('S3 unavailable')
+        return submit_batch(race, records)
+
+    log.submit_batch = flaky_submit_batch
+    submissions = submission_queue.SubmissionQueue(log, batch_size=5, flush_interval=0.05)
+    receipts, errors = submit_all(submissions, 60)
+    assert errors and all(isinstance(error, OSError) for error in errors)
+    assert len(receipts) + len(errors) == 60
+    assert {receipt.id for receipt in receipts} <= stored_ids(log)
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_worker_crash_mid_batch_loses_no_acknowledged_submission(log):
+    submit_batch = log.submit_batch
+    calls = []
+
+    def crashing_submit_batch(race, records):
+        # The first race of the first batch is written, then the worker dies
+        calls.append(race)
+        if len(calls) == 2:
+            raise WorkerKilled()
+        return submit_batch(race, records)
+
+    log.submit_batch = crashing_submit_batch
+    submissions = submission_queue.SubmissionQueue(log, batch_size=30, flush_interval=0.2, write_timeout=1)
+    receipts, errors = submit_all(submissions, 30)
+    assert len(calls) >= 2
+    assert receipts and errors and all(isinstance(error, submission_queue.SubmissionNotStored) for error in errors)
+    assert {receipt.id for receipt in receipts} <= stored_ids(log)
+
+    # The next submission starts a new worker
+    receipt = submissions.submit(record('User 99', RACES[0], 0))
+    assert receipt.id in stored_ids(log)
@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pytest
+import storage
+import utils
+
+COLUMNS = ['Name', 'Race'] + utils.PREDICTION_COLUMNS
+RACES = ['Bahrain Grand Prix', 'Saudi Arabian Grand Prix', 'Australian Grand Prix']
+
+def record(name, race, version):
+    return {'Name': name, 'Race': race,
+            **{column: f'{name} {version} {column}' for column in utils.PREDICTION_COLUMNS}}
+
+def assert_latest(predictions_df, expected):
+    """predictions_df holds exactly one row per (Name, Race) in expected, with the expected picks."""
+    assert not predictions_df.duplicated(subset=['Name', 'Race']).any()
+    assert len(predictions_df) == len(expected)
+    rows = {(row['Name'], row['Race']): row for row in predictions_df.to_dict('records')}
+    for (name, race), version in expected.items():
+        assert rows[(name, race)]['P1'] == record(name, race, version)['P1']
+
+@pytest.fixture(params=['csv', 'partitioned'])
+def backend(request, s3, monkeypatch):
+    if request.param == 'csv':
+        s3.put_object(Bucket='wpc-test', Key='predictions.csv', Body=pd.DataFrame(columns=COLUMNS).to_csv(index=False))
+    else:
+        monkeypatch.setenv('PREDICTIONS_PREFIX', 'predictions/')
+    return request.param
+
+def test_concurrent_submits_are_all_kept(s3):
+    log = utils.league_data().submission_log
+
+    def submit(user):
+        for race in RACES:
+            for version in range(3):
+                log.submit(record(f'User {user}', race, version))
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(submit, range(16)))
+
+    latest_df, keys = log.latest()
+    assert len(keys) == 16 * len(RACES) * 3
+    assert_latest(latest_df, {(f'User {user}', race): 2 for user in range(16) for race in RACES})
+
+def test_concurrent_compactions_lose_nothing(s3, backend):
+    log = utils.league_data().submission_log
+    users = 12
+    versions = 4
+    done = threading.Event()
+    errors = []
+
+    def submit(user):
+        for version in range(versions):
+            for race in RACES:
+                log.submit(record(f'User {user}', race, version))
+
+    def compact():
+        while not done.is_set():
+            try:
+                utils.compact_submissions()
+            except Exception as e:
+                errors.append(e)
+
+    def read():
+        # Stored predictions with the pending submissions on top, like load_predictions
+        while not done.is_set():
+            submissions_df, _ = log.latest()
+            predictions_df = storage.apply_submissions(utils.read_stored_predictions(), submissions_df, COLUMNS)
+            if predictions_df.duplicated(subset=['Name', 'Race']).any():
+                errors.append(AssertionError('duplicate prediction rows'))
+
+    compactors = [threading.Thread(target=compact) for _ in range(3)] + [threading.Thread(target=read)]
+    for thread in compactors:
+        thread.start()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        list(executor.map(submit, range(users)))
+    done.set()
+    for thread in compactors:
+        thread.join()
+    assert not errors
+
+    utils.compact_submissions()
+    assert log.keys() == []
+    assert_latest(utils.read_stored_predictions(),
+                  {(f'User {user}', race): versions - 1 for user in range(users) for race in RACES})
+
+def test_compaction_does_not_overwrite_a_newer_store(s3, backend):
+    log = utils.league_data().submission_log
+    log.submit(record('User 1', RACES[0], 0))
+    predictions_df, versions = utils.read_stored_versions()
+    # Someone else compacts a newer submission after we read the store
+    log.submit(record('User 1', RACES[0], 1))
+    utils.compact_submissions()
+    with pytest.raises(storage.WriteConflict):
+        utils.write_stored_predictions(
+            storage.apply_submissions(predictions_df, pd.DataFrame([record('User 1', RACES[0], 0)]), COLUMNS),
+            versions=versions)
+    assert_latest(utils.read_stored_predictions(), {('User 1', RACES[0]): 1})
+
+def test_apply_submissions_replaces_and_appends():
+    predictions_df = pd.DataFrame([record('User 1', RACES[0], 0), record('User 2', RACES[0], 0)])
+    submissions_df = pd.DataFrame([{**record('User 2', RACES[0], 1), 'Submitted': 'now'},
+                                   {**record('User 3', RACES[0], 0), 'Submitted': 'now'}])
+    applied_df = storage.apply_submissions(predictions_df, submissions_df, COLUMNS)
+    assert list(applied_df.columns) == COLUMNS
+    assert_latest(applied_df, {('User 1', RACES[0]): 0, ('User 2', RACES[0]): 1, ('User 3', RACES[0]): 0})
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.05)
+
+def test_submissions_are_compacted_in_the_background(backend, monkeypatch):
+    monkeypatch.setattr(utils, 'COMPACT_INTERVAL', 0.2)
+    data = utils.league_data()
+    for user in range(5):
+        data.submission_queue.submit(record(f'User {user}', RACES[user % 2], 0))
+    wait_for(lambda: not data.submission_log.keys())
+    assert_latest(utils.read_stored_predictions(), {(f'User {user}', RACES[user % 2]): 0 for user in range(5)})
+
+def test_leftover_submissions_are_compacted_on_first_read(backend, monkeypatch):
+    monkeypatch.setattr(utils, 'COMPACT_INTERVAL', 0.2)
+    # Written by a process that is gone now
+    storage.SubmissionLog(utils.get_s3_client(), 'wpc-test', 'submissions/').submit(record('User 1', RACES[0], 0))
+    data = utils.league_data()
+    assert utils.get_prediction_codes().user_picks('User 1', RACES[0]) is not None
+    wait_for(lambda: not data.submission_log.keys())
+    assert_latest(utils.read_stored_predictions(), {('User 1', RACES[0]): 0})
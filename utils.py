@@ -1,12 +1,28 @@
 import streamlit as st
 import pandas as pd
-import boto3
+import numpy as np
 from io import StringIO
 from dotenv import load_dotenv
 import os
-from datetime import datetime, timezone
-import requests
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import threading
+import copy
+import analytics
+import f1_api
+import leagues
+import live
+import metrics
+import participants
+import prediction_codes
+import ranking
+import schedule
+import simulator
+import storage
+import submission_queue
+import standings
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,8 +32,26 @@ aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
 aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
 # aws_region = os.getenv('AWS_DEFAULT_REGION')
 
-# Initialize an S3 client
-s3_client = boto3.client('s3')
+# Shared data layer: st.cache_resource/st.cache_data entries live in the server
+# process and are shared by every session, so N users on race day cost one
+# download per entry and TTL instead of N. Keys always include the season (and
+# round or league where it applies). F1 API TTLs are in f1_api.
+PARTICIPANTS_REFRESH = 60  # seconds between ETag checks of the participants file, logins in between stay in process
+LEAGUES_REFRESH = 60  # seconds between checks of the leagues index, login reruns in between stay in process
+PREDICTIONS_TTL = 60  # other processes' submissions show up within this, our own immediately
+SIMULATED_SEASONS = 10000  # what-if seasons per championship simulation
+SIMULATION_SEED = 0  # fixed, so the odds only move when the standings or predictions do
+LIVE_POLL = 15  # seconds between polls of the position feed during a race, one poller per race and process
+COMPACT_INTERVAL = 60  # seconds between background compactions of the submission log while submissions come in
+COMPACT_ATTEMPTS = 5  # times compact_submissions starts over after another compaction wrote the store first
+
+# Function to get the S3 client shared by the whole app, created on first use
+@st.cache_resource(show_spinner=False)
+def get_s3_client():
+    # boto3 is slow to import, so a cold start only pays for it once S3 is needed
+    import boto3
+    # Every call through the client is timed and counted, see metrics.instrument_s3
+    return metrics.instrument_s3(boto3.client('s3'))
 
 # F1 scoring dict, anything beyond 10 gets 0 points
 f1_scoring_dict = {
@@ -33,116 +67,418 @@ f1_scoring_dict = {
     10:1
 }
 
-# Function to read the CSV file from S3
-def read_predictions_from_s3():
+# F1 API endpoints, shared by every league playing the same season
+SCHEDULE_URL = "https://api.jolpi.ca/ergast/f1/{season}/races/"  # race schedule
+DRIVERS_URL = "https://api.jolpi.ca/ergast/f1/{season}/{round}/drivers/?format=json"  # drivers for a round
+RESULTS_URL = "https://api.jolpi.ca/ergast/f1/{season}/{round}/results/?format=json"  # results for a round
+LAPS_URL = "https://api.jolpi.ca/ergast/f1/{season}/{round}/laps/{{lap}}/?format=json"  # timings for one lap
+
+# Prediction columns, in predicted finishing order
+PREDICTION_COLUMNS = ['P1', 'P2', 'P3', 'P4', 'P5', 'P6', 'P7', 'P8', 'P9', 'P10']
+
+class LeagueData:
+    """The S3-backed stores holding one league's data for one season."""
+
+    def __init__(self, league):
+        keys = leagues.storage_keys(league)
+        bucket = os.getenv('S3_BUCKET_NAME')
+        s3_client = get_s3_client()
+        self.league = league
+        self.predictions_file = keys['predictions_file']
+        self.standings_file = keys['standings_file']
+        self.analytics_file = keys['analytics_file']
+        self.participants_file = keys['participants_file']
+
+        # Parsed copy of the predictions file, only re-downloaded when its ETag changes
+        self.predictions_store = storage.CachedS3Object(s3_client, bucket, keys['predictions_file'],
+                                                        metrics.timed('parse.predictions_csv')(pd.read_csv))
+
+        # Once migrated (see manage.py migrate-predictions), predictions are stored as one
+        # Parquet object per race under the predictions prefix instead of the single CSV
+        self.partitioned_store = (storage.PartitionedPredictionsStore(s3_client, bucket, keys['predictions_prefix'],
+                                                                      columns=['Name', 'Race'] + PREDICTION_COLUMNS)
+                                  if keys['predictions_prefix'] else None)
+
+        # Members and password hashes, see participants.ParticipantDirectory
+        self.participant_directory = participants.ParticipantDirectory(
+            storage.CachedS3Object(s3_client, bucket, keys['participants_file'],
+                                   metrics.timed('parse.participants')(participants.parse_participants)),
+            refresh_interval=PARTICIPANTS_REFRESH)
+
+        # Scoring tables for races with official results, see get_race_snapshot
+        self.snapshot_store = storage.SnapshotStore(s3_client, bucket, keys['snapshots_prefix'])
+
+        # Running season standings, see get_season_standings
+        self.standings_store = storage.CachedS3Object(s3_client, bucket, keys['standings_file'],
+                                                      lambda body: standings.SeasonStandings.from_json(body.read()))
+
+        # Prediction analytics, see get_prediction_cube
+        self.analytics_store = storage.CachedS3Object(s3_client, bucket, keys['analytics_file'],
+                                                      lambda body: analytics.PredictionCube.from_bytes(body.read()))
+
+        # New submissions are written as one object each under the submissions prefix, so
+        # concurrent submitters never overwrite each other. compact_submissions folds
+        # them into the predictions store above, in the background every COMPACT_INTERVAL
+        # seconds after new submissions (or manage.py compact-submissions by hand).
+        self.submission_log = storage.SubmissionLog(s3_client, bucket, keys['submissions_prefix'])
+        self.compactor = submission_queue.Compactor(lambda races: compact_submissions(races, league),
+                                                    interval=COMPACT_INTERVAL)
+
+        # Submit queues a validated record and waits for the background thread to write its batch to the log
+        self.submission_queue = submission_queue.register(submission_queue.SubmissionQueue(
+            self.submission_log, on_stored=lambda races: self._stored(races)))
+
+    def _stored(self, races):
+        for race in races:
+            invalidate_predictions(race, self.league)
+        self.compactor.add(races)
+
+# Index of all hosted leagues
+@st.cache_resource(show_spinner=False)
+def get_leagues_index():
+    return storage.CachedS3Object(get_s3_client(), os.getenv('S3_BUCKET_NAME'), leagues.index_key(),
+                                  leagues.parse_index)
+
+# Function to get the league the current session is looking at
+def current_league():
     try:
-        # Get the file from S3
-        response = s3_client.get_object(Bucket=os.getenv('S3_BUCKET_NAME'), Key=os.getenv('PREDICTIONS_FILE'))
-        # Read the content into a pandas DataFrame
-        predictions_df = pd.read_csv(response['Body'])
-        return predictions_df
+        return st.session_state.get('league', leagues.default_league())
+    except Exception:
+        # Not running inside a Streamlit session (e.g. manage.py)
+        return leagues.default_league()
+
+# One LeagueData per (season, league), shared by every session in this process
+@st.cache_resource(show_spinner=False)
+def _league_data(league):
+    return LeagueData(league)
+
+# Function to get the stores for a league (the session's league by default)
+def league_data(league=None):
+    return _league_data(league or current_league())
+
+# Function to get a league's participants, shared by every session
+@metrics.timed('io.participants')
+def get_participants(league=None):
+    """Returns {username: Participant} for the league, raising on S3 errors."""
+    return league_data(league).participant_directory.participants()
+
+# Function to check a login: returns the user's Participant, or None if the password is wrong
+@metrics.timed('auth.login')
+def authenticate(username, password, league=None):
+    return league_data(league).participant_directory.authenticate(username, password)
+
+# Function to check whether the logged in user may see the admin pages (ADMIN_USERS, comma separated names)
+def is_admin():
+    admins = {name.strip() for name in (os.getenv('ADMIN_USERS') or '').split(',') if name.strip()}
+    return st.session_state.get('authenticated', False) and st.session_state.get('user') in admins
+
+# Function to list every hosted league, the original one first
+def list_leagues(refresh=False):
+    """refresh: check the index now instead of using the copy from the last LEAGUES_REFRESH seconds"""
+    indexed = read_leagues_index() if refresh else indexed_leagues()
+    default_league = leagues.default_league()
+    return [default_league] + [league for league in indexed if league != default_league]
+
+# The leagues index as last checked, so login reruns in between don't touch S3
+@st.cache_data(ttl=LEAGUES_REFRESH, show_spinner=False)
+def indexed_leagues():
+    return read_leagues_index()
+
+def read_leagues_index():
+    try:
+        return get_leagues_index().get()
+    except Exception:
+        # No index yet: only the original league exists
+        return []
+
+# Function to let the user browse other seasons of their league
+def select_season():
+    league = current_league()
+    seasons = [other for other in list_leagues() if other.name == league.name]
+    if len(seasons) > 1:
+        league = st.sidebar.selectbox("Season", seasons, index=seasons.index(league) if league in seasons else 0,
+                                      format_func=lambda other: other.season)
+    return league
+
+# Function to add a league (or a new season of one) to the index
+def register_league(league):
+    # Read fresh, so a league another process just added is not dropped
+    registered = list_leagues(refresh=True)
+    if league not in registered:
+        registered.append(league)
+    body = leagues.index_body(registered)
+    response = get_s3_client().put_object(Bucket=os.getenv('S3_BUCKET_NAME'), Key=leagues.index_key(),
+                                    Body=body, ContentType='application/json')
+    get_leagues_index().set(registered, response.get('ETag'))
+    indexed_leagues.clear()
+    return registered
+
+# Function to read the compacted predictions (without pending submissions)
+def read_stored_predictions(races=None, league=None):
+    return read_stored_versions(races, league)[0]
+
+# Function to read the compacted predictions along with the version they were read at
+def read_stored_versions(races=None, league=None):
+    """
+    Returns (predictions_df, versions), versions being what write_stored_predictions
+    needs to only write if nobody else changed the store in between.
+    """
+    data = league_data(league)
+    if data.partitioned_store is not None:
+        # Only the partitions for the requested races are fetched
+        return data.partitioned_store.read_versioned(races)
+    # Revalidate our copy against S3 and re-parse only if the file changed
+    predictions_df, etag = data.predictions_store.get_versioned()
+    if races is not None:
+        predictions_df = predictions_df[predictions_df['Race'].isin(races)]
+    return predictions_df, etag
+
+# Function to read the stored predictions plus pending submissions, shared by every session
+@st.cache_resource(ttl=PREDICTIONS_TTL, show_spinner=False)
+@metrics.timed('io.predictions')
+def load_predictions(league, races=None):
+    """
+    Returns the predictions as prediction_codes.PredictionCodes, raising on S3
+    errors. Only the codes stay cached, the parsed frames are dropped.
+    """
+    predictions_df = read_stored_predictions(None if races is None else list(races), league)
+    # Submissions that have not been compacted yet win over the stored rows
+    data = league_data(league)
+    submissions_df, keys = data.submission_log.latest(None if races is None else list(races))
+    if keys:
+        # Left over from before this process started (or from another one), fold them in soon
+        data.compactor.add(submissions_df['Race'].unique())
+    predictions_df = storage.apply_submissions(predictions_df, submissions_df, ['Name', 'Race'] + PREDICTION_COLUMNS)
+    with metrics.span('encode.predictions'):
+        return prediction_codes.PredictionCodes.from_frame(predictions_df, PREDICTION_COLUMNS)
+
+# Race selections load_predictions was asked for, per league, so invalidate_predictions
+# can drop every cached entry that holds a race
+_selections = {}
+_selections_lock = threading.Lock()
+
+def _read_prediction_codes(races, league):
+    races = None if races is None else tuple(races)
+    with _selections_lock:
+        _selections.setdefault(league, set()).add(races)
+    return load_predictions(league, races)
+
+# Function to get the predictions as integer codes, optionally only for some races
+def get_prediction_codes(races=None, league=None):
+    # The returned codes are shared between sessions, so don't modify them in place
+    try:
+        return _read_prediction_codes(races, league or current_league())
     except Exception as e:
         st.error(f"Error reading file from S3: {e}")
-        return pd.DataFrame()
+        return prediction_codes.PredictionCodes.from_frame(pd.DataFrame(), PREDICTION_COLUMNS)
 
-# Function to save the updated CSV back to S3
-def save_predictions_to_s3(predictions_df):
-    try:
-        # Convert DataFrame to CSV in memory
-        csv_buffer = StringIO()
-        predictions_df.to_csv(csv_buffer, index=False)
-        csv_buffer.seek(0)
+# Function to read the predictions from S3 as a DataFrame, optionally only for some races
+def read_predictions_from_s3(races=None, league=None):
+    return get_prediction_codes(races, league).to_frame(races)
 
-        # Upload the CSV file to S3
-        s3_client.put_object(Bucket=os.getenv('S3_BUCKET_NAME'), Key=os.getenv('PREDICTIONS_FILE'), Body=csv_buffer.getvalue())
+# Function to drop cached predictions after a change to a race
+def invalidate_predictions(race, league=None):
+    league = league or current_league()
+    # Every cached selection holding the race, from one race to the whole season
+    with _selections_lock:
+        selections = [races for races in _selections.get(league, ()) if races is None or race in races]
+    for races in selections:
+        load_predictions.clear(league, races)
+
+# Function to write the predictions store, raising on errors
+def write_stored_predictions(predictions_df, league=None, versions=None):
+    """
+    versions: from read_stored_versions, to only write if the store did not change
+    since predictions_df was read (raising storage.WriteConflict otherwise)
+    """
+    data = league_data(league)
+    if data.partitioned_store is not None:
+        # Only the races present in predictions_df are rewritten
+        data.partitioned_store.save(predictions_df, versions)
+        load_predictions.clear()
+        return
+
+    # Convert DataFrame to CSV in memory
+    csv_buffer = StringIO()
+    predictions_df.to_csv(csv_buffer, index=False)
+    csv_buffer.seek(0)
+
+    # Upload the CSV file to S3
+    if versions is not None:
+        data.predictions_store.put_if_unchanged(predictions_df, csv_buffer.getvalue(), versions)
+    else:
+        response = get_s3_client().put_object(Bucket=os.getenv('S3_BUCKET_NAME'), Key=data.predictions_file, Body=csv_buffer.getvalue())
+        # What we just wrote is now the current version of the file
+        data.predictions_store.set(predictions_df, response.get('ETag'))
+    load_predictions.clear()
+
+# Function to save the updated predictions back to S3
+def save_predictions_to_s3(predictions_df, league=None):
+    try:
+        write_stored_predictions(predictions_df, league)
         st.success("Predictions saved successfully!")
     except Exception as e:
         st.error(f"Error saving file to S3: {e}")
 
 # Function to get the list of drivers from the F1 API
-def get_drivers(round):
-    url = f"https://api.jolpi.ca/ergast/f1/2025/{round}/drivers/?format=json"  # API endpoint for 2025 drivers
-    response = requests.get(url)
-    data = response.json()
+def get_drivers(round, season=None):
+    return fetch_drivers(round, season or current_league().season)
+
+@st.cache_data(ttl=f1_api.DRIVERS_TTL, show_spinner=False)
+@metrics.timed('io.drivers')
+def fetch_drivers(round, season):
+    """Returns the driver names for a round, shared by every session."""
+    # The entry list for a race can still change until the race is over
+    data = f1_api.get_json(DRIVERS_URL.format(season=season, round=round), ttl=f1_api.DRIVERS_TTL,
+                           is_final=lambda data: race_is_over(round, season))
     
     # Extract the list of driver names
     drivers = [f"{driver['givenName']} {driver['familyName']}" for driver in data['MRData']['DriverTable']['Drivers']]
     
     return drivers
 
+# Function to get a season's parsed schedule from the F1 API, shared by every session
+@st.cache_resource(ttl=f1_api.SCHEDULE_TTL, show_spinner=False)
+@metrics.timed('io.schedule')
+def load_schedule(season):
+    return schedule.Schedule.from_json(f1_api.get_json(SCHEDULE_URL.format(season=season), ttl=f1_api.SCHEDULE_TTL))
+
+# Function to get the schedule for a season (the session's by default)
+def get_schedule(season=None):
+    return load_schedule(season or current_league().season)
+
 # Function to get the race list from the F1 API
-def get_race_list():
-    url = "https://api.jolpi.ca/ergast/f1/2025/races/"  # New API endpoint for 2025 race schedule
-    response = requests.get(url)
-    data = response.json()
-    
-    # Extract the list of race names
-    race_list = [race['raceName'] for race in data['MRData']['RaceTable']['Races']]
-    race_dict = {item: index for index, item in enumerate(race_list, start=1)}
-    return race_list,race_dict
-
-# Function to get the race start time from the F1 API
-def get_race_start_time(race_location):
-    url = "https://api.jolpi.ca/ergast/f1/2025/races/"  # New API endpoint for 2025 race schedule
-    response = requests.get(url)
-    data = response.json()
-    
-    # Loop through the races and find the race matching the race_location
-    for race in data['MRData']['RaceTable']['Races']:
-        if race['raceName'] == race_location:
-            race_start_time = race['date'] + "T" + race['time']
-            utc_dt = datetime.strptime(race_start_time, "%Y-%m-%dT%H:%M:%SZ")
-            return utc_dt
-    
-    return None
+def get_race_list(season=None):
+    season_schedule = get_schedule(season)
+    return season_schedule.names(), season_schedule.race_dict()
+
+# Function to get the race start time (timezone-aware, UTC) from the F1 API
+def get_race_start_time(race_location, season=None):
+    return get_schedule(season).start_time(race_location)
+
+# Function to check whether a round has been run, using the cached schedule
+def race_is_over(round, season=None):
+    return get_schedule(season).is_over(round)
 
 # Function to update predictions
-def update_predictions(new_predictions, name, race_location):
-    # Read the current predictions from S3
-    predictions_df = read_predictions_from_s3()
+@metrics.timed('io.submit')
+def update_predictions(new_predictions, name, race_location, league=None):
+    """
+    Validates and queues a submission, returning its submission_queue.Receipt
+    once it is written to S3 (or None if it was rejected or could not be saved).
+    The server's clock at this point decides whether it made the race start,
+    however long the batched write takes.
+    """
+    league = league or current_league()
+    record = {'Name': name, 'Race': race_location, **dict(zip(PREDICTION_COLUMNS, new_predictions))}
+    submitted_at = datetime.now(timezone.utc)
+    try:
+        submission_queue.validate_submission(record, PREDICTION_COLUMNS,
+                                             get_schedule(league.season).start_time(race_location), submitted_at)
+        receipt = league_data(league).submission_queue.submit(record, submitted_at)
+    except submission_queue.SubmissionRejected as e:
+        st.error(str(e))
+        return None
+    except Exception as e:
+        st.error(f"Error saving predictions: {e}")
+        return None
+    st.success(f"Predictions received at {receipt.submitted_at.strftime('%H:%M:%S')} UTC and saved! Receipt: {receipt.id[:8]}")
+    return receipt
 
-    # Check if the user has predictions for this race
-    user_predictions = predictions_df[(predictions_df['Name'] == name) & (predictions_df['Race'] == race_location)]
-    
-    # If the user already has predictions, update them, otherwise add new row
-    if not user_predictions.empty:
-        predictions_df.loc[(predictions_df['Name'] == name) & (predictions_df['Race'] == race_location), 
-                            ['P1', 'P2', 'P3', 'P4', 'P5', 'P6', 'P7', 'P8', 'P9', 'P10']] = new_predictions
-    else:
-        new_row = [{
-            'Name': name,
-            'Race': race_location,
-            'P1': new_predictions[0],
-            'P2': new_predictions[1],
-            'P3': new_predictions[2],
-            'P4': new_predictions[3],
-            'P5': new_predictions[4],
-            'P6': new_predictions[5],
-            'P7': new_predictions[6],
-            'P8': new_predictions[7],
-            'P9': new_predictions[8],
-            'P10': new_predictions[9],
-        }]
-        predictions_df = pd.concat([predictions_df,
-                                    pd.DataFrame(new_row)],
-                                    axis=0,
-                                    ignore_index=True)
-
-    # Save the updated predictions to S3
-    save_predictions_to_s3(predictions_df)
+# Function to fold pending submissions into the predictions store
+@metrics.timed('io.compact')
+def compact_submissions(races=None, league=None):
+    """
+    Writes the latest pending submission per (Name, Race) into the predictions
+    store and then deletes exactly the submissions that were folded in, so
+    anything submitted while compacting stays pending for the next run.
+    The store is only written if it is unchanged since it was read, so when two
+    compactions run at once the one that loses starts over from the other's result.
+    Returns the number of submission objects compacted.
+    """
+    data = league_data(league)
+    for attempt in range(COMPACT_ATTEMPTS):
+        submissions_df, keys = data.submission_log.latest(races)
+        if not keys:
+            return 0
+        # With partitioned storage only the races that have submissions are rewritten
+        stored_races = list(submissions_df['Race'].unique()) if data.partitioned_store is not None else None
+        predictions_df, versions = read_stored_versions(stored_races, league)
+        # Listed again after reading the store, so a submission compacted in between
+        # can't be folded in on top of a newer one it already holds
+        submissions_df, keys = data.submission_log.latest(stored_races if stored_races is not None else races)
+        if not keys:
+            return 0
+        predictions_df = storage.apply_submissions(predictions_df, submissions_df, ['Name', 'Race'] + PREDICTION_COLUMNS)
+        try:
+            # Raises before anything is deleted if the store could not be written
+            write_stored_predictions(predictions_df, league, versions)
+        except storage.WriteConflict:
+            if attempt == COMPACT_ATTEMPTS - 1:
+                raise
+            continue
+        data.submission_log.delete(keys)
+        return len(keys)
 
 # Function to get the race results from the F1 API
-def get_race_results(round):
-    url = f"https://api.jolpi.ca/ergast/f1/2025/{round}/results/?format=json"
-
+def get_race_results(round, season=None):
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = fetch_race_results(round, season or current_league().season)
     except Exception as e:
         st.warning(f"Unable to fetch race results for round {round}: {e}")
         return {}
+    return parse_race_results(data)
+
+# Function to get the race results for many rounds at once
+def get_season_results(rounds, season=None):
+    """
+    Fetches the results for all rounds concurrently over the shared API session.
+    Returns: {round: results_dict}, with an empty dict for any round that has no
+    official results yet or could not be fetched (same as get_race_results)
+    """
+    rounds = list(rounds)
+    if not rounds:
+        return {}
+    # Resolved here, the worker threads can't see the Streamlit session
+    season = season or current_league().season
+    try:
+        payloads = fetch_season_results(tuple(rounds), season)
+    except Exception:
+        # Go round by round, so the rounds that worked still show and each failure gets its warning
+        return {round: get_race_results(round, season) for round in rounds}
+    return {round: parse_race_results(data) for round, data in payloads.items()}
 
+@st.cache_data(ttl=f1_api.RESULTS_TTL, show_spinner=False)
+@metrics.timed('io.results')
+def fetch_race_results(round, season):
+    """
+    Returns the raw results payload for a round, raising on network/HTTP errors
+    (which are not cached). Shared by every session.
+    """
+    return request_race_results(round, season)
+
+@st.cache_data(ttl=f1_api.RESULTS_TTL, show_spinner=False)
+@metrics.timed('io.season_results')
+def fetch_season_results(rounds, season):
+    """
+    Returns {round: raw results payload} for a tuple of rounds, fetched concurrently.
+    Raises if any round fails, so a partly fetched season is never cached.
+    """
+    with ThreadPoolExecutor(max_workers=min(f1_api.MAX_CONNECTIONS, len(rounds))) as executor:
+        # The workers only call the F1 API, never a Streamlit cache. Each runs in a copy
+        # of this context, so its spans count towards the current render
+        futures = {round: executor.submit(contextvars.copy_context().run, request_race_results, round, season)
+                   for round in rounds}
+        return {round: future.result() for round, future in futures.items()}
+
+def request_race_results(round, season):
+    """Returns the raw results payload for a round through the F1 API cache, raising on errors."""
+    # Published results never change, so they are cached permanently
+    return f1_api.get_json(RESULTS_URL.format(season=season, round=round), ttl=f1_api.RESULTS_TTL,
+                           is_final=results_published)
+
+def parse_race_results(data):
+    """Returns {position: driver} from a results payload, or {} if there are no results yet."""
     # Safely navigate the JSON structure; if 'Races' is empty, return empty dict
     races = data.get('MRData', {}).get('RaceTable', {}).get('Races', [])
     if not races:
@@ -164,21 +500,66 @@ def get_race_results(round):
         results_dict[position] = driver_name
     return results_dict
 
+def results_published(data):
+    """Returns True if an F1 API results payload contains official results."""
+    races = data.get('MRData', {}).get('RaceTable', {}).get('Races', [])
+    return bool(races) and bool(races[0].get('Results'))
+
+def race_results_frame(race_results_dict):
+    """
+    race_results_dict: {position: driver} as returned by get_race_results
+    Returns: DataFrame indexed by finishing position with a 'Driver' column
+    """
+    return pd.DataFrame([race_results_dict]).T.rename(columns={0:'Driver'})
+
+def finishing_positions(race_results):
+    """
+    race_results: DataFrame indexed by finishing position with a 'Driver' column
+    Returns: Series mapping driver name -> finishing position (first occurrence wins)
+    """
+    if race_results.empty or 'Driver' not in race_results.columns:
+        return pd.Series(dtype='float64')
+    positions = pd.Series(race_results.index, index=race_results['Driver'])
+    return positions[~positions.index.duplicated(keep='first')]
+
+def position_points(drivers, predicted_pos, positions):
+    """
+    Vectorized max(0, 10 - |real - predicted|) for any number of predictions.
+    drivers: array-like of predicted driver names
+    predicted_pos: array-like of predicted positions (1-10), same length as drivers
+    positions: Series from finishing_positions
+    Drivers that are missing from the results (or not predicted) score 0.
+    """
+    real_pos = pd.Series(drivers).map(positions).to_numpy(dtype='float64')
+    points = np.maximum(0, 10 - np.abs(real_pos - np.asarray(predicted_pos)))
+    return np.nan_to_num(points, nan=0).astype('int64')
+
+def score_predictions(predictions_df, race_results):
+    """
+    Scores every predictor for one race in a single batched pass.
+    predictions_df: DataFrame with columns ['Name', 'P1', ..., 'P10'] for one race
+    race_results: DataFrame indexed by finishing position with a 'Driver' column
+    Returns: long DataFrame with columns ['Predictor', 'Position', 'Driver', 'Points'],
+    one row per (predictor, predicted position).
+    """
+    # Only the first submission per user counts, same as calculate_scores
+    predictions_df = predictions_df.drop_duplicates(subset='Name', keep='first')
+    long_df = predictions_df.melt(id_vars='Name', value_vars=PREDICTION_COLUMNS,
+                                  var_name='Position', value_name='Driver')
+    # melt stacks column by column, so predicted positions repeat in blocks
+    predicted_pos = np.repeat(np.arange(1, len(PREDICTION_COLUMNS) + 1), len(predictions_df))
+    long_df['Points'] = position_points(long_df['Driver'], predicted_pos,
+                                        finishing_positions(race_results))
+    return long_df.rename(columns={'Name': 'Predictor'})
+
 def calculate_scores(user_predictions, race_results):
-    user_scores = []
-    predicted_pos = 1
     for drop_col in ['Race','Name']:
         if drop_col in user_predictions.columns:
             user_predictions = user_predictions.drop(columns=drop_col)
-    for position in user_predictions.columns:
-        driver = user_predictions[position].values[0]
-        try:
-            real_pos = race_results[race_results['Driver'] == driver].index.tolist()[0]
-            user_scores.append(max(0,(10 - abs(real_pos-predicted_pos))))
-        except:
-            user_scores.append(0)
-        predicted_pos += 1
-    
+    drivers = user_predictions.iloc[0].values
+    user_scores = position_points(drivers, np.arange(1, len(drivers) + 1),
+                                  finishing_positions(race_results))
+
     user_predictions = user_predictions.reset_index(drop=True).T.rename(columns={0:'Driver'})
     user_predictions['Points'] = user_scores
     return user_predictions
@@ -189,39 +570,359 @@ def apply_f1_scoring(user_scores_df):
     Returns: DataFrame with columns ['Predictor', 'Score', 'Points', 'Place']
     Handles ties: tied users get full points for that place, next place(s) are skipped.
     """
-    # Sort by Score descending
-    user_scores_df = user_scores_df.sort_values(by='Score', ascending=False).reset_index(drop=True)
-    user_scores_df['Place'] = None
-    user_scores_df['Points'] = 0
-
-    place = 1
-    i = 0
-    n = len(user_scores_df)
-    while i < n:
-        # Find all users with this score (tie group)
-        score = user_scores_df.loc[i, 'Score']
-        tie_indices = user_scores_df.index[user_scores_df['Score'] == score].tolist()
-        tie_count = len(tie_indices)
-        # Assign place and F1 points to all in tie group
-        for idx in tie_indices:
-            user_scores_df.at[idx, 'Place'] = place
-            user_scores_df.at[idx, 'Points'] = f1_scoring_dict.get(place, 0)
-        # Move to next group, skipping places for ties
-        i += tie_count
-        place += tie_count
-
-    user_scores_df['Place'] = user_scores_df['Place'].astype(int)
+    # Sort by Score descending, with min-rank places for ties
+    order, places = ranking.rank_descending(user_scores_df['Score'].to_numpy())
+    user_scores_df = user_scores_df.iloc[order].reset_index(drop=True)
+    user_scores_df['Place'] = places
+    user_scores_df['Points'] = ranking.places_to_points(places, f1_scoring_dict)
     return user_scores_df
 
+def rank_race_scores(race_scores):
+    """
+    race_scores: long DataFrame from score_predictions
+    Returns DataFrame with columns: Predictor, Score, Points, Place
+    """
+    user_scores_df = (race_scores.groupby('Predictor', sort=False)['Points'].sum()
+                      .reset_index().rename(columns={'Points': 'Score'}))
+    return apply_f1_scoring(user_scores_df)
+
+@metrics.timed('score.user_scores')
 def get_all_user_scores(predictions_df, race_results):
     """
     Returns DataFrame with columns: Predictor, Score, Points, Place
     """
-    all_scores = []
-    for this_user in predictions_df.Name.unique():
-        this_user_predictions = predictions_df[predictions_df['Name'] == this_user]
-        user_score = calculate_scores(this_user_predictions, race_results).Points.sum()
-        all_scores.append({'Predictor': this_user, 'Score': user_score})
-    user_scores_df = pd.DataFrame(all_scores)
-    user_scores_df = apply_f1_scoring(user_scores_df)
-    return user_scores_df
\ No newline at end of file
+    return rank_race_scores(score_predictions(predictions_df, race_results))
+
+def score_codes(picks, positions):
+    """
+    Vectorized max(0, 10 - |real - predicted|) straight on driver codes.
+    picks: (users, positions) array of driver codes from prediction_codes, -1 for none
+    positions: float array of each driver code's finishing position, NaN if not classified
+    Returns: int64 array of points, same shape as picks
+    """
+    real_pos = np.append(positions, np.nan)[picks]
+    points = np.maximum(0, 10 - np.abs(real_pos - np.arange(1, picks.shape[1] + 1)))
+    return np.nan_to_num(points, nan=0).astype('int64')
+
+@metrics.timed('score.race_table')
+def score_race_codes(codes, race, race_results):
+    """
+    Full scoring table for one race, one row per predictor in finishing order.
+    codes: prediction_codes.PredictionCodes holding the race
+    Returns DataFrame with columns: Predictor, Score, Place, Points, P1-P10 (the
+    predicted drivers) and 'P1 Points'-'P10 Points' (points for each pick)
+    """
+    users, picks = codes.race_picks(race)
+    positions = (pd.Series(codes.drivers, dtype=object).map(finishing_positions(race_results))
+                 .to_numpy(dtype='float64'))
+    points = score_codes(picks, positions)
+    race_table = pd.DataFrame({'Predictor': codes.decode_users(users), 'Score': points.sum(axis=1)})
+    race_table[PREDICTION_COLUMNS] = codes.decode_drivers(picks)
+    race_table[[f'{col} Points' for col in PREDICTION_COLUMNS]] = points
+    # apply_f1_scoring reorders whole rows, so the picks stay with their predictor
+    race_table = apply_f1_scoring(race_table)
+    return race_table[['Predictor', 'Score', 'Place', 'Points'] + PREDICTION_COLUMNS +
+                      [f'{col} Points' for col in PREDICTION_COLUMNS]]
+
+def score_race_table(predictions_df, race_results):
+    """score_race_codes for a DataFrame of one race's predictions."""
+    codes = prediction_codes.PredictionCodes.from_frame(predictions_df, PREDICTION_COLUMNS)
+    return score_race_codes(codes, codes.races[0] if codes.races else None, race_results)
+
+# One provisional scorer per race, shared by every session watching it
+@st.cache_resource(show_spinner=False)
+def _live_race(race, round, league):
+    # LIVE_REPLAY_FILE replays a recorded race instead of polling the API, {round} is filled in
+    replay_file = os.getenv('LIVE_REPLAY_FILE')
+    if replay_file:
+        feed = live.ReplayFeed.from_file(replay_file.format(round=round))
+    else:
+        feed = live.ApiPositionFeed(LAPS_URL.format(season=league.season, round=round),
+                                    DRIVERS_URL.format(season=league.season, round=round),
+                                    RESULTS_URL.format(season=league.season, round=round), ttl=LIVE_POLL)
+    # Predictions are closed once the race has started, so they are read once. Read errors
+    # are raised rather than shown so that a failed read is not cached
+    return live.LiveRace(feed, live.LiveScorer(_read_prediction_codes([race], league), race),
+                         apply_f1_scoring, poll_interval=LIVE_POLL)
+
+# Function to get the provisional scores of a race that is running
+def get_live_race(race, round, league=None):
+    """
+    Returns the shared live.LiveRace for a race. Its snapshot() is what the
+    Results page shows until the official results are published, or None if
+    the race's predictions could not be read.
+    """
+    try:
+        return _live_race(race, round, league or current_league())
+    except Exception as e:
+        st.warning(f"Unable to start live scoring for the {race}: {e}")
+        return None
+
+# Function to get a race's scoring table, computed once and then read from S3
+@metrics.timed('race_snapshot')
+def get_race_snapshot(race, round, codes=None, race_results_dict=None, league=None):
+    """
+    Returns the score_race_table for a race with official results, or None if
+    there are no results yet. The table is persisted per race and reused for as
+    long as the race's predictions and results are unchanged.
+    codes (PredictionCodes)/race_results_dict: pass them if already loaded to skip the reads
+    """
+    league = league or current_league()
+    if race_results_dict is None:
+        race_results_dict = get_race_results(round, league.season)
+    if not race_results_dict:
+        return None
+    if codes is None:
+        codes = get_prediction_codes([race], league)
+
+    with metrics.span('score.fingerprint'):
+        # Fingerprinted as the decoded rows, so it does not depend on how the codes were numbered
+        snapshot_fingerprint = storage.fingerprint(race_results_dict, codes.to_frame([race]))
+    try:
+        snapshot = league_data(league).snapshot_store.get(race, snapshot_fingerprint)
+    except Exception:
+        snapshot = None
+    if snapshot is not None:
+        return snapshot
+
+    snapshot = score_race_codes(codes, race, race_results_frame(race_results_dict))
+    try:
+        league_data(league).snapshot_store.put(race, snapshot, snapshot_fingerprint)
+    except Exception as e:
+        # The freshly computed table is still good, it just won't be reused
+        st.warning(f"Unable to save the results snapshot for {race}: {e}")
+    return snapshot
+
+def snapshot_user_table(snapshot, user):
+    """
+    Returns one predictor's picks from a race snapshot in the same shape as
+    calculate_scores (index P1-P10, columns Driver and Points), or an empty
+    DataFrame if they did not predict the race.
+    """
+    user_row = snapshot[snapshot['Predictor'] == user]
+    if user_row.empty:
+        return pd.DataFrame()
+    user_row = user_row.iloc[0]
+    return pd.DataFrame({'Driver': user_row[PREDICTION_COLUMNS].to_numpy(),
+                         'Points': user_row[[f'{col} Points' for col in PREDICTION_COLUMNS]].to_numpy(dtype='int64')},
+                        index=PREDICTION_COLUMNS)
+
+@metrics.timed('score.season_scores')
+def get_season_scores(codes, race_list, race_dict, league=None):
+    """
+    Scores every (user, race) pair once for the whole season.
+    Only races that have predictions and official results are included.
+    Returns: (all_scores, all_f1_points, all_places), three DataFrames indexed by
+    Predictor with one column per scored race in race_list order. Users who did
+    not predict a race get 0 for it.
+    """
+    league = league or current_league()
+    predicted_races = set(codes.races)
+    season_results = get_season_results((race_dict[race] for race in race_list if race in predicted_races),
+                                        league.season)
+    race_scores = {}
+    for race in race_list:
+        if race not in predicted_races:
+            continue
+        # If there are no official results yet for this race, skip it
+        snapshot = get_race_snapshot(race, race_dict[race], codes, season_results[race_dict[race]], league)
+        if snapshot is None:
+            continue
+        race_scores[race] = snapshot
+
+    races = list(race_scores)
+    users = pd.Index(pd.unique(np.concatenate([race_scores[race]['Predictor'].to_numpy() for race in races]))
+                     if races else [], name='Predictor')
+    # Preallocate the (user, race) matrices and fill one race column at a time
+    scores = np.zeros((len(users), len(races)), dtype='int64')
+    points = np.zeros((len(users), len(races)), dtype='int64')
+    places = np.zeros((len(users), len(races)), dtype='int64')
+    for j, race in enumerate(races):
+        rows = users.get_indexer(race_scores[race]['Predictor'])
+        scores[rows, j] = race_scores[race]['Score'].to_numpy()
+        points[rows, j] = race_scores[race]['Points'].to_numpy()
+        places[rows, j] = race_scores[race]['Place'].to_numpy()
+
+    all_scores = pd.DataFrame(scores, index=users, columns=races)
+    all_f1_points = pd.DataFrame(points, index=users, columns=races)
+    all_places = pd.DataFrame(places, index=users, columns=races)
+    return all_scores, all_f1_points, all_places
+
+# Function to load the persisted running standings
+@metrics.timed('io.load_standings')
+def load_standings(league=None):
+    # The returned standings are shared between sessions, so don't modify them in place
+    try:
+        return league_data(league).standings_store.get()
+    except Exception:
+        # Nothing saved yet (or unreadable): start from an empty season
+        return standings.SeasonStandings()
+
+# Function to persist the running standings
+@metrics.timed('io.save_standings')
+def save_standings(season_standings, league=None):
+    data = league_data(league)
+    response = get_s3_client().put_object(Bucket=os.getenv('S3_BUCKET_NAME'), Key=data.standings_file,
+                                    Body=season_standings.to_json(), ContentType='application/json')
+    data.standings_store.set(season_standings, response.get('ETag'))
+
+# Function to get the season standings, applying only newly finalized races
+@metrics.timed('season_standings')
+def get_season_standings(race_list, race_dict, league=None):
+    """
+    Returns the persisted SeasonStandings after applying any race that has
+    official results (and predictions) but is not included yet. Races already
+    in the standings are not fetched or rescored again, and races that have not
+    started can't have results, so a typical render checks one round at most.
+    """
+    league = league or current_league()
+    season_standings = load_standings(league)
+    race_schedule = get_schedule(league.season)
+    pending = [race for race in race_list
+               if race not in season_standings.races and race_schedule.has_started(race)]
+    season_results = get_season_results((race_dict[race] for race in pending), league.season)
+    finalized = [race for race in pending if season_results[race_dict[race]]]
+    if not finalized:
+        return season_standings
+
+    codes = get_prediction_codes(finalized, league)
+    finalized = [race for race in finalized if codes.has_race(race)]
+    if not finalized:
+        return season_standings
+
+    season_standings = copy.deepcopy(season_standings)
+    for race in finalized:
+        snapshot = get_race_snapshot(race, race_dict[race], codes, season_results[race_dict[race]], league)
+        season_standings.apply_race(race, snapshot)
+    try:
+        save_standings(season_standings, league)
+    except Exception as e:
+        st.warning(f"Unable to save the season standings: {e}")
+    return season_standings
+
+# Function to rebuild the season standings from scratch
+def rebuild_standings(race_list, race_dict, league=None):
+    """
+    Recomputes the standings from every race and saves them.
+    Returns (rebuilt standings, list of differences from the incremental standings
+    that were saved before); an empty list means the incremental path was right.
+    """
+    league = league or current_league()
+    all_scores, all_f1_points, all_places = get_season_scores(get_prediction_codes(league=league),
+                                                              race_list, race_dict, league)
+    rebuilt = standings.SeasonStandings.from_season_scores(all_scores, all_f1_points, all_places)
+    differences = load_standings(league).differences(rebuilt)
+    save_standings(rebuilt, league)
+    return rebuilt, differences
+
+# Function to load the persisted prediction analytics
+@metrics.timed('io.load_analytics')
+def load_prediction_cube(league=None):
+    # The returned cube is shared between sessions, so don't modify it in place
+    try:
+        return league_data(league).analytics_store.get()
+    except Exception:
+        # Nothing saved yet (or unreadable): start from an empty season
+        return analytics.PredictionCube(len(PREDICTION_COLUMNS))
+
+# Function to persist the prediction analytics
+@metrics.timed('io.save_analytics')
+def save_prediction_cube(cube, league=None):
+    data = league_data(league)
+    response = get_s3_client().put_object(Bucket=os.getenv('S3_BUCKET_NAME'), Key=data.analytics_file,
+                                          Body=cube.to_bytes(), ContentType='application/octet-stream')
+    data.analytics_store.set(cube, response.get('ETag'))
+
+# Function to get the prediction analytics, adding only races that changed state
+@metrics.timed('prediction_cube')
+def get_prediction_cube(race_list, race_dict, league=None):
+    """
+    Returns the persisted analytics.PredictionCube after adding the picks of
+    races that have started (their predictions are closed) and the scores of
+    races whose official results are in. Races already in the cube are not
+    read or counted again.
+    """
+    league = league or current_league()
+    cube = load_prediction_cube(league)
+    season_schedule = get_schedule(league.season)
+    # Submissions accepted just before the start can take a moment to reach S3
+    closed_at = datetime.now(timezone.utc) - timedelta(seconds=PREDICTIONS_TTL)
+    new_picks = [race for race in race_list if race not in cube.races and season_schedule.has_started(race, closed_at)]
+    codes = get_prediction_codes(new_picks, league) if new_picks else None
+    new_picks = [race for race in new_picks if codes.has_race(race)]
+
+    unscored = [race for race in race_list if race not in cube.scored_races
+                and (race in cube.races or race in new_picks)]
+    season_results = get_season_results((race_dict[race] for race in unscored), league.season)
+    new_scores = [race for race in unscored if season_results[race_dict[race]]]
+    if not new_picks and not new_scores:
+        return cube
+
+    cube = copy.deepcopy(cube)
+    for race in new_picks:
+        with metrics.span('analytics.add_picks'):
+            cube.add_picks(race, codes)
+    for race in new_scores:
+        snapshot = get_race_snapshot(race, race_dict[race], race_results_dict=season_results[race_dict[race]],
+                                     league=league)
+        if snapshot is not None:
+            cube.add_scores(race, snapshot)
+    try:
+        save_prediction_cube(cube, league)
+    except Exception as e:
+        st.warning(f"Unable to save the prediction analytics: {e}")
+    return cube
+
+# Function to simulate who can still win the league
+@metrics.timed('simulate_championship')
+def simulate_championship(race_list, race_dict, league=None, n_seasons=SIMULATED_SEASONS, seed=SIMULATION_SEED):
+    """
+    Returns the simulator.simulate table for the league's remaining rounds, or
+    None before anyone has scored. Every user is assumed to keep submitting
+    their latest predictions, and driver strengths come from the scored races.
+    """
+    league = league or current_league()
+    season_standings = get_season_standings(race_list, race_dict, league)
+    if not season_standings.users:
+        return None
+    # Each user's picks for the latest race they predicted
+    codes = get_prediction_codes(league=league)
+
+    # Rounds still to score: not started yet, or run with predictions and awaiting results.
+    # A round that started without predictions is closed and never scores
+    race_schedule = get_schedule(league.season)
+    remaining = [race for race in race_list if race not in season_standings.races
+                 and (not race_schedule.has_started(race) or codes.has_race(race))]
+    latest_picks = np.full((len(codes.users), len(PREDICTION_COLUMNS)), -1, dtype='int64')
+    if codes.races:
+        race_order = np.array([race_list.index(race) if race in race_list else -1 for race in codes.races])
+        predicted_order = np.where(codes.order >= 0, race_order[:, None], -1)
+        predicted = predicted_order.max(axis=0) >= 0
+        latest = predicted_order.argmax(axis=0)
+        latest_picks[predicted] = codes.picks[latest, np.arange(len(codes.users))][predicted]
+    known_users = set(season_standings.users)
+    users = season_standings.users + [user for user in codes.users if user not in known_users]
+    extra = len(users) - len(season_standings.users)
+
+    # Re-code the picks against the drivers the simulation races: those picked and those with results
+    season_results = get_season_results((race_dict[race] for race in season_standings.races), league.season)
+    drivers = sorted({codes.drivers[code] for code in np.unique(latest_picks) if code >= 0}
+                     | {driver for results in season_results.values() for driver in results.values()})
+    driver_lookup = np.append(pd.Index(drivers).get_indexer(codes.drivers), -1)
+    rows = pd.Index(codes.users).get_indexer(users)
+    picks = np.full((len(users), len(PREDICTION_COLUMNS)), -1, dtype='int64')
+    picks[rows >= 0] = driver_lookup[latest_picks[rows[rows >= 0]]]
+    season = simulator.Season(users=users,
+                              points=np.pad(season_standings.totals, (0, extra)),
+                              p1=np.pad(season_standings.p1, (0, extra)),
+                              podiums=np.pad(season_standings.podiums, (0, extra)),
+                              picks=picks,
+                              strengths=simulator.driver_strengths(season_results.values(), drivers),
+                              remaining=len(remaining))
+    return run_simulation(season, n_seasons, seed)
+
+# Simulations are keyed on their inputs, so every session shares one run per change
+@st.cache_data(max_entries=32, show_spinner=False)
+@metrics.timed('simulate')
+def run_simulation(season, n_seasons, seed):
+    return simulator.simulate(season, f1_scoring_dict, n_seasons, seed)